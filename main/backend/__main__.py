@@ -0,0 +1,10 @@
+# `python -m backend ...` from the main directory; see launcher.py
+import os
+import sys
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import launcher  # noqa: E402
+
+launcher.main()
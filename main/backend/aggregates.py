@@ -0,0 +1,109 @@
+import datetime
+
+from db import to_epoch_ms
+
+# --- Per-user daily mood aggregates ---
+# mood_daily holds one row per (user, UTC day, mood). It is updated in the same
+# transaction as the entry insert/delete, so stats read O(days) rows instead of
+# scanning a user's entries.
+
+
+def entry_day(created_at):
+    """The UTC calendar day (YYYY-MM-DD) an entry's ISO createdAt falls on."""
+    return created_at[:10]
+
+
+def add_entry(conn, user_id, created_at, mood, sentiment):
+    add_entries(conn, user_id, [(created_at, mood, sentiment)])
+
+
+def add_entries(conn, user_id, entries):
+    """Fold many (created_at, mood, sentiment) entries in with one upsert per (day, mood)."""
+    cells = {}
+    for created_at, mood, sentiment in entries:
+        key = (entry_day(created_at), mood)
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = [1, sentiment, sentiment, sentiment]
+        else:
+            cell[0] += 1
+            cell[1] += sentiment
+            cell[2] = min(cell[2], sentiment)
+            cell[3] = max(cell[3], sentiment)
+    conn.executemany('''INSERT INTO mood_daily (user_id, day, mood, count, sentiment_sum, sentiment_min, sentiment_max)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, day, mood) DO UPDATE SET
+            count = count + excluded.count,
+            sentiment_sum = sentiment_sum + excluded.sentiment_sum,
+            sentiment_min = MIN(sentiment_min, excluded.sentiment_min),
+            sentiment_max = MAX(sentiment_max, excluded.sentiment_max)''',
+        [(user_id, day, mood, *cell) for (day, mood), cell in cells.items()])
+
+
+def remove_entry(conn, user_id, created_at, mood, sentiment):
+    """Undo add_entry() for a row that has already been deleted from entries."""
+    day = entry_day(created_at)
+    conn.execute('''UPDATE mood_daily SET count = count - 1, sentiment_sum = sentiment_sum - ?
+        WHERE user_id = ? AND day = ? AND mood = ?''', (sentiment, user_id, day, mood))
+    conn.execute('DELETE FROM mood_daily WHERE user_id = ? AND day = ? AND mood = ? AND count <= 0',
+                 (user_id, day, mood))
+    # min/max cannot be decremented; recompute them from that one day's entries
+    conn.execute('''UPDATE mood_daily SET (sentiment_min, sentiment_max) = (
+            SELECT MIN(sentiment), MAX(sentiment) FROM entries
+            WHERE user_id = ? AND mood = ? AND created_ms >= ? AND created_ms < ?)
+        WHERE user_id = ? AND day = ? AND mood = ?''',
+        (user_id, mood, *day_bounds_ms(day), user_id, day, mood))
+
+
+def day_bounds_ms(day):
+    start_ms = to_epoch_ms(datetime.datetime.strptime(day, '%Y-%m-%d'))
+    return start_ms, start_ms + 86400000
+
+
+def rebuild(conn, user_id=None):
+    """Recompute aggregates from entries (for one user, or everyone)."""
+    where = 'WHERE createdAt IS NOT NULL AND mood IS NOT NULL'
+    params = ()
+    if user_id is not None:
+        where += ' AND user_id = ?'
+        params = (user_id,)
+    conn.execute(f'DELETE FROM mood_daily {"WHERE user_id = ?" if user_id is not None else ""}', params)
+    conn.execute(f'''INSERT INTO mood_daily (user_id, day, mood, count, sentiment_sum, sentiment_min, sentiment_max)
+        SELECT user_id, substr(createdAt, 1, 10), mood, COUNT(*), TOTAL(sentiment), MIN(sentiment), MAX(sentiment)
+        FROM entries {where}
+        GROUP BY user_id, substr(createdAt, 1, 10), mood''', params)
+
+
+# --- Queries ---
+def mood_totals(conn, user_id, start_day, end_day):
+    """Per-mood totals for start_day..end_day inclusive."""
+    rows = conn.execute('''SELECT mood, SUM(count) AS count, SUM(sentiment_sum) AS sentiment_sum,
+            MIN(sentiment_min) AS sentiment_min, MAX(sentiment_max) AS sentiment_max
+        FROM mood_daily WHERE user_id = ? AND day BETWEEN ? AND ?
+        GROUP BY mood ORDER BY count DESC''', (user_id, start_day, end_day)).fetchall()
+    return [{
+        'mood': r['mood'],
+        'count': r['count'],
+        'avg_sentiment': round(r['sentiment_sum'] / r['count'], 3) if r['count'] else None,
+        'min_sentiment': r['sentiment_min'],
+        'max_sentiment': r['sentiment_max'],
+    } for r in rows]
+
+
+def calendar(conn, user_id, start_day, end_day):
+    """One heatmap cell per day that has entries: total count, average sentiment and dominant mood."""
+    days = {}
+    rows = conn.execute('''SELECT day, mood, count, sentiment_sum FROM mood_daily
+        WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day''', (user_id, start_day, end_day))
+    for r in rows:
+        cell = days.setdefault(r['day'], {'day': r['day'], 'count': 0, 'sentiment_sum': 0.0, 'top_mood': None, 'top_count': 0})
+        cell['count'] += r['count']
+        cell['sentiment_sum'] += r['sentiment_sum'] or 0.0
+        if r['count'] > cell['top_count']:
+            cell['top_mood'], cell['top_count'] = r['mood'], r['count']
+    return [{
+        'day': cell['day'],
+        'count': cell['count'],
+        'avg_sentiment': round(cell['sentiment_sum'] / cell['count'], 3),
+        'top_mood': cell['top_mood'],
+    } for cell in days.values()]
@@ -0,0 +1,315 @@
+"""ASGI serving mode: async handlers for the slow, downstream-bound routes.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    # or: python asgi.py
+
+/api/chat, /api/chat/stream, /api/analyze, /api/personality, /api/auth/verify-email and
+/api/auth/reset-password await pooled httpx clients here, so a request
+waiting 10-30 s on Gemini or the analyzer holds no thread. Their SQLite work
+runs on a small bounded thread pool. Every other route is the unchanged
+Flask app, run through a2wsgi on its own bounded pool (register, resend and
+request-reset only queue outbox rows, so they stay there).
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import db
+import http_client
+import jsonio
+import metrics
+import outbox
+import passwords
+import personality
+import ratelimit
+import server
+import streaming
+
+DB_THREADS = int(os.environ.get('MJ_ASGI_DB_THREADS', db.POOL_SIZE))
+WSGI_THREADS = int(os.environ.get('MJ_ASGI_WSGI_THREADS', 16))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='asgi-db')
+
+
+# --- Helpers ---
+async def run_db(fn, *args):
+    """Run fn(conn, *args) on the DB thread pool with a pooled connection."""
+    def call():
+        conn = db.pool.acquire()
+        try:
+            return fn(conn, *args)
+        finally:
+            db.pool.release(conn)
+    # copy_context() so query timings land in this request's Server-Timing
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(db_executor, ctx.run, call)
+
+
+def json_response(payload, status=200, headers=None):
+    response = Response(jsonio.dumps_bytes(payload), status_code=status, media_type='application/json', headers=headers)
+    # Preflight OPTIONS requests fall through to Flask-CORS on the mounted app
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(400, 'Request body must be JSON')
+    return data if isinstance(data, dict) else {}
+
+
+async def authenticate(request):
+    """Return (claims, None) or (None, error response); mirrors server.auth_required."""
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return None, json_response({'success': False, 'message': 'Authorization token required'}, 401)
+    try:
+        data = jwt.decode(auth.split(' ', 1)[1], server.SECRET, algorithms=['HS256'])
+        user_id = data['id']
+    except (jwt.PyJWTError, KeyError) as e:
+        # A malformed token or a missing claim is a 401, as in auth_required
+        print(f"Auth error: {e}")
+        return None, json_response({'success': False, 'message': 'Invalid or expired token.'}, 401)
+    if not data.get('verified') and not await run_db(lambda conn: server.is_user_verified(user_id, conn)):
+        return None, json_response(
+            {'success': False, 'message': 'Email not verified. Please verify your email to continue.'}, 403)
+    return data, None
+
+
+async def throttle(request, rule, user):
+    """ratelimit.limit() for async routes: None if allowed, else the 429 response."""
+    email = None
+    if 'email' in ratelimit.RULES[rule]:
+        # Starlette keeps the body, so the handler can still read it
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and isinstance(data.get('email'), str):
+            email = data['email']
+    args = (rule, ratelimit.client_ip(request.client.host if request.client else None,
+                                      request.headers.get('X-Forwarded-For')), user['id'] if user else None, email)
+    if isinstance(ratelimit.store, ratelimit.SQLiteStore):
+        retry_after = await asyncio.get_running_loop().run_in_executor(db_executor, ratelimit.check, *args)
+    else:
+        retry_after = ratelimit.check(*args)
+    if retry_after:
+        return json_response({'success': False, 'message': 'Too many requests. Please try again shortly.'}, 429,
+                             headers={'Retry-After': ratelimit.retry_after_header(retry_after)})
+    return None
+
+
+routes = []
+
+
+def endpoint(path, methods, auth=False, limit=None):
+    """Register an async route; with auth=True the handler also receives the token claims.
+    `limit` names a ratelimit rule, checked after authentication."""
+    def decorator(fn):
+        async def call(request):
+            user = None
+            if auth:
+                user, error = await authenticate(request)
+                if error:
+                    return error
+            if limit and ratelimit.ENABLED:
+                error = await throttle(request, limit, user)
+                if error:
+                    return error
+            return await fn(request, user) if auth else await fn(request)
+
+        async def handler(request):
+            start = metrics.start_request() if metrics.ENABLED else None
+            response = None
+            try:
+                try:
+                    response = await call(request)
+                except HTTPException as exc:
+                    response = json_response({'success': False, 'message': exc.detail}, exc.status_code)
+                return response
+            finally:
+                if start is not None:
+                    elapsed = time.perf_counter() - start
+                    metrics.observe_request(request.method, path, response.status_code if response else 500, elapsed)
+                    if response is not None:
+                        response.headers['Server-Timing'] = metrics.server_timing(elapsed)
+                    metrics.finish_request()
+
+        routes.append(Route(path, handler, methods=methods))
+        return fn
+    return decorator
+
+
+# --- Routes ---
+@endpoint('/api/chat', ['POST'], auth=True, limit='chat')
+async def chat_query(request, user):
+    data = await read_json(request)
+    message = data.get('message', '')
+    if not message:
+        return json_response({'success': False, 'message': 'No message provided'}, 400)
+
+    try:
+        response = await http_client.async_chat.post('/chat', json={'message': message}, timeout=20)
+        if response.status_code != 200:
+            return json_response({'success': False, 'message': 'Gemini API error'}, 500)
+        return json_response({'success': True, 'reply': response.json().get('reply', '')})
+    except http_client.CircuitOpenError as e:
+        return json_response(
+            {'success': False, 'message': 'The assistant is temporarily unavailable. Please try again shortly.'},
+            503, headers={'Retry-After': str(max(1, round(e.retry_after)))})
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error contacting Gemini: {e}'}, 500)
+
+
+@endpoint('/api/chat/stream', ['POST'], auth=True, limit='chat')
+async def chat_stream(request, user):
+    start = time.perf_counter()
+    data = await read_json(request)
+    message = data.get('message', '')
+    if not message:
+        return json_response({'success': False, 'message': 'No message provided'}, 400)
+
+    try:
+        upstream = await http_client.async_chat.post(
+            '/chat/stream', json={'message': message}, timeout=20, stream=True)
+    except http_client.CircuitOpenError as e:
+        return json_response(
+            {'success': False, 'message': 'The assistant is temporarily unavailable. Please try again shortly.'},
+            503, headers={'Retry-After': str(max(1, round(e.retry_after)))})
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error contacting Gemini: {e}'}, 500)
+
+    if upstream.status_code != 200:
+        await upstream.aclose()
+        return json_response({'success': False, 'message': 'Gemini API error'}, 500)
+
+    # Starlette cancels the body on client disconnect, which closes upstream
+    stats = streaming.StreamStats('/api/chat/stream', start)
+    body = streaming.relay_async(upstream.aiter_lines(), upstream.aclose, stats)
+    response = StreamingResponse(body, media_type='text/event-stream', headers=streaming.HEADERS)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@endpoint('/api/analyze', ['POST'], auth=True)
+async def analyze_text(request, user):
+    data = await read_json(request)
+    text = data.get('text', '')
+
+    try:
+        response = await http_client.async_analyzer.post('/predict', json={'text': text}, timeout=15)
+        if response.status_code == 200:
+            pers = response.json()
+        else:
+            pers = {'error': 'Analyzer returned non-200 response'}
+    except Exception as e:
+        pers = {'error': str(e)}
+
+    return json_response({
+        'success': True,
+        'sentiment_score': server.gemini_sentiment(text),
+        'personality': pers.get('personality_profile'),
+    })
+
+
+@endpoint('/api/personality', ['GET'], auth=True)
+async def get_personality_api(request, user):
+    # Same flow as server.get_personality_api, with the analyzer call awaited
+    payload, pending = await run_db(personality.lookup, user['id'])
+    if pending:
+        result = await personality.analyze_entries_async(personality.pending_texts(pending))
+        payload = await run_db(personality.complete, user['id'], pending, result)
+    return json_response(payload)
+
+
+@endpoint('/api/auth/verify-email', ['POST'])
+async def verify_email(request):
+    data = await read_json(request)
+    email = data.get('email')
+    code = data.get('code')
+    if not email or not code:
+        return json_response({'success': False, 'message': 'Email and verification code are required.'}, 400)
+
+    try:
+        response = await http_client.async_email.post('/verify-code', json={'email': email, 'code': code}, timeout=10)
+        response.raise_for_status()
+        result = response.json()
+    except Exception as e:
+        print(f"Error calling email service: {e}")
+        return json_response({'success': False, 'message': 'Could not connect to verification service.'}, 500)
+
+    if not result.get('success'):
+        return json_response({'success': False, 'message': result.get('message', 'Verification failed')}, 400)
+    user = await run_db(server.mark_verified, email)
+    if not user:
+        return json_response({'success': False, 'message': 'User not found after verification.'}, 404)
+    return json_response({
+        'success': True,
+        'message': 'Email verified successfully!',
+        'token': server.issue_token(user['id'], user['email']),
+    })
+
+
+@endpoint('/api/auth/reset-password', ['POST'], limit='reset_password')
+async def reset_password(request):
+    data = await read_json(request)
+    email = data.get('email')
+    code = data.get('code')
+    new_password = data.get('password')
+    if not email or not code or not new_password:
+        return json_response({'success': False, 'message': 'Email, code, and new password required'}, 400)
+    # Hash first, as in server.reset_password; the thread only waits on the hashing pool
+    try:
+        password_hash = await asyncio.to_thread(server.hash_pwd, new_password)
+    except passwords.HasherBusy:
+        return json_response({'success': False, 'message': 'The server is busy. Please try again in a moment.'}, 503,
+                             headers={'Retry-After': '1'})
+
+    try:
+        response = await http_client.async_email.post(
+            '/verify-password-reset', json={'email': email, 'code': code}, timeout=30)
+        if response.status_code != 200 or not response.json().get('success'):
+            return json_response({'success': False, 'message': 'Invalid reset code'}, 400)
+    except Exception as e:
+        print(f"Email service connection error: {e}")
+        return json_response({'success': False, 'message': 'Reset service error'}, 500)
+
+    await run_db(server.set_password, email, password_hash)
+    return json_response({'success': True, 'message': 'Password updated successfully'})
+
+
+# --- Application ---
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    server.init_db()
+    outbox.start_dispatcher()
+    personality.start_worker()
+    yield
+    for client in http_client.ASYNC_SERVICES:
+        await client.aclose()
+    # db_executor stays up (its idle threads end with the process), so the app
+    # can be started again in the same process, as the tests do
+
+
+# Async routes are matched first; everything else (and every OPTIONS
+# preflight, which the async routes do not accept) goes to Flask.
+routes.append(Mount('/', app=WSGIMiddleware(server.app, workers=WSGI_THREADS)))
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    print("🚀 ASGI server starting on port 5000...")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
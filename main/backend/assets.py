@@ -0,0 +1,195 @@
+"""Static assets: content-hashed URLs, precompressed copies and cache headers.
+
+Build step (run after changing anything in ../public, before deploying):
+
+    python assets.py build
+
+writes `<file>.gz` (and `<file>.br` when the brotli package is installed)
+next to every compressible asset, plus asset-manifest.json with each file's
+content hash. Without a build the server still hashes files at startup, it
+just has no precompressed copies to send.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+import threading
+from urllib.parse import quote
+
+from flask import abort, send_file
+from werkzeug.security import safe_join
+
+import compression
+
+PUBLIC_DIR = os.path.abspath(os.environ.get('MJ_PUBLIC_DIR', os.path.join(os.path.dirname(__file__), '..', 'public')))
+MANIFEST_NAME = 'asset-manifest.json'
+URL_PREFIX = '/assets'
+PRECOMPRESS_EXTENSIONS = frozenset(['.js', '.css', '.json', '.svg', '.html', '.txt', '.webmanifest'])
+PRECOMPRESS_MIN_BYTES = 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SIDECAR_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+mimetypes.add_type('application/javascript', '.js')
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def iter_files(root):
+    """Relative paths (with /) of every servable file under root."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for name in sorted(filenames):
+            if name.startswith('.') or name == MANIFEST_NAME or name.endswith(('.gz', '.br')):
+                continue
+            yield os.path.relpath(os.path.join(dirpath, name), root).replace(os.sep, '/')
+
+
+def _describe(root, rel, encodings=()):
+    full = os.path.join(root, rel)
+    st = os.stat(full)
+    return {'hash': file_hash(full), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'encodings': list(encodings)}
+
+
+def build(root=PUBLIC_DIR):
+    """Precompress compressible assets and write the manifest. Returns the manifest."""
+    codings = [c for c in compression.ENCODINGS if c in SIDECAR_SUFFIXES]
+    files = {}
+    for rel in iter_files(root):
+        full = os.path.join(root, rel)
+        encodings = []
+        if os.path.splitext(rel)[1].lower() in PRECOMPRESS_EXTENSIONS and os.path.getsize(full) >= PRECOMPRESS_MIN_BYTES:
+            with open(full, 'rb') as f:
+                data = f.read()
+            for coding in codings:
+                packed = compression.compress(data, coding, static=True)
+                sidecar = full + SIDECAR_SUFFIXES[coding]
+                if len(packed) < len(data):
+                    with open(sidecar, 'wb') as f:
+                        f.write(packed)
+                    encodings.append(coding)
+                    print(f"  {rel}{SIDECAR_SUFFIXES[coding]}: {len(data):,} -> {len(packed):,} bytes")
+                elif os.path.exists(sidecar):
+                    os.remove(sidecar)
+        files[rel] = _describe(root, rel, encodings)
+    manifest = {'files': files}
+    with open(os.path.join(root, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    print(f"Wrote {MANIFEST_NAME} ({len(files)} files)")
+    return manifest
+
+
+class AssetManifest:
+    """Content hashes for the files under `root`.
+
+    Loaded from the build manifest when there is one, otherwise computed on
+    first use. A file whose size or mtime no longer matches its record is
+    rehashed on the spot, and its precompressed copies (now stale) are ignored.
+    """
+
+    def __init__(self, root=PUBLIC_DIR):
+        self.root = root
+        self._files = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME), encoding='utf-8') as f:
+                return json.load(f)['files']
+        except (OSError, ValueError, KeyError):
+            return {rel: _describe(self.root, rel) for rel in iter_files(self.root)}
+
+    def lookup(self, rel):
+        """The manifest record for a relative path, or None if there is no such file."""
+        with self._lock:
+            if self._files is None:
+                self._files = self._load()
+            entry = self._files.get(rel)
+        full = safe_join(self.root, rel)
+        if full is None or not os.path.isfile(full):
+            return None
+        st = os.stat(full)
+        if entry is None or (entry['size'], entry['mtime_ns']) != (st.st_size, st.st_mtime_ns):
+            entry = _describe(self.root, rel)
+            with self._lock:
+                self._files[rel] = entry
+        return entry
+
+    def paths(self):
+        with self._lock:
+            if self._files is None:
+                self._files = self._load()
+            return list(self._files)
+
+    def url(self, rel):
+        """The content-hashed URL for a relative path (falls back to the plain static URL)."""
+        entry = self.lookup(rel)
+        if entry is None:
+            return '/' + quote(rel)
+        return f"{URL_PREFIX}/{entry['hash']}/{quote(rel)}"
+
+
+manifest = AssetManifest()
+
+
+def send_asset(url_hash, rel):
+    """Serve a file requested under its hashed URL, using a precompressed copy when the client accepts one."""
+    entry = manifest.lookup(rel)
+    if entry is None:
+        abort(404)
+    full = safe_join(manifest.root, rel)
+    coding = compression.negotiate(tuple(c for c in compression.ENCODINGS if c in entry['encodings']))
+    mimetype = mimetypes.guess_type(rel)[0] or 'application/octet-stream'
+    if coding:
+        response = send_file(full + SIDECAR_SUFFIXES[coding], mimetype=mimetype)
+        response.headers['Content-Encoding'] = coding
+    else:
+        response = send_file(full, mimetype=mimetype)
+    if entry['encodings']:
+        response.vary.add('Accept-Encoding')
+    # An old hash (file changed since the page was rendered) still gets the
+    # current bytes, but must not be cached forever under that URL
+    response.headers['Cache-Control'] = IMMUTABLE if url_hash == entry['hash'] else 'no-cache'
+    return response
+
+
+# --- index.html ---
+_LOCAL_REF_RE = re.compile(r'''(\b(?:src|href)=)(["'])(?![a-z][a-z0-9+.-]*:|//|#|/)([^"'?#]+)\2''', re.I)
+_index_cache = {}
+
+
+def render_index(name='index.html'):
+    """index.html with local script/style references rewritten to hashed URLs.
+
+    The full path -> URL map is also exposed as window.ASSET_URLS so the app
+    can use hashed URLs for files it loads at runtime (animations, sounds).
+    """
+    entry = manifest.lookup(name)
+    if entry is None:
+        abort(404)
+    urls = {rel: manifest.url(rel) for rel in manifest.paths() if rel != name}
+    key = (entry['hash'], tuple(sorted(urls.items())))
+    cached = _index_cache.get(name)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(os.path.join(manifest.root, name), encoding='utf-8') as f:
+        html = f.read()
+    html = _LOCAL_REF_RE.sub(lambda m: f'{m[1]}{m[2]}{urls.get(m[3], m[3])}{m[2]}', html)
+    script = f'<script>window.ASSET_URLS = {json.dumps(urls, separators=(",", ":"))};</script>\n'
+    html = html.replace('</head>', script + '</head>', 1)
+    _index_cache[name] = (key, html)
+    return html
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['build']:
+        sys.exit('Usage: python assets.py build')
+    build()
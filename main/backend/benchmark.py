@@ -0,0 +1,371 @@
+"""Micro-benchmarks for the journal API.
+
+Runs against a throwaway database through Flask's test client, so no servers
+(email, analyzer, Gemini) need to be running. Usage:
+
+    python benchmark.py db [--requests 2000] [--threads 4]
+    python benchmark.py writes [--requests 2000]
+    python benchmark.py http [--requests 2000] [--threads 4]
+    python benchmark.py sentiment [--corpus 100000]
+    python benchmark.py serialize [--requests 2000] [--threads 4]
+    python benchmark.py login [--requests 200] [--threads 8] [--scrypt-n 16384] [--scrypt-r 8] [--hash-workers N]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Point the app at a scratch database before it is imported
+_tmpdir = tempfile.mkdtemp(prefix='mj-bench-')
+os.environ.setdefault('MJ_DB', os.path.join(_tmpdir, 'bench.db'))
+
+import requests  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+import db  # noqa: E402
+import http_client  # noqa: E402
+import jsonio  # noqa: E402
+import passwords  # noqa: E402
+import ratelimit  # noqa: E402
+import sentiment  # noqa: E402
+import server  # noqa: E402
+
+
+def make_user(email='bench@example.com'):
+    """Create a verified user and return an Authorization header for them."""
+    with server.app.app_context():
+        conn = db.get_db()
+        row = conn.execute('SELECT id FROM users WHERE email=?', (email,)).fetchone()
+        if row:
+            uid = row['id']
+        else:
+            cur = conn.execute(
+                'INSERT INTO users (email, password, is_verified, createdAt) VALUES (?,?,1,?)',
+                (email, server.hash_pwd('bench'), '2024-01-01T00:00:00')
+            )
+            conn.commit()
+            uid = cur.lastrowid
+    token = server.issue_token(uid, email)
+    return {'Authorization': f'Bearer {token}'}
+
+
+def legacy_get_db():
+    # The pre-pool behaviour: a brand new connection for every call
+    conn = sqlite3.connect(db.DB)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def run(label, fn, total, threads):
+    per_thread = max(1, total // threads)
+    errors = []
+    latencies = []
+
+    def worker():
+        client = server.app.test_client()
+        mine = []
+        for _ in range(per_thread):
+            t0 = time.perf_counter()
+            resp = fn(client)
+            mine.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+        latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    done = per_thread * threads
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{label:<40} {done / elapsed:10.1f} req/s  p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  "
+          f"({done} requests, {len(errors)} errors)")
+
+
+def bench_db(args):
+    headers = make_user()
+
+    def get_entries(client):
+        return client.get('/api/entries?limit=50', headers=headers)
+
+    def post_entry(client):
+        return client.post('/api/entries', json={'text': 'Feeling calm and grateful today', 'mood': 'happy'}, headers=headers)
+
+    pooled_get_db = server.get_db
+    for label, impl in (('connect-per-call', legacy_get_db), ('pooled', pooled_get_db)):
+        server.get_db = impl
+        run(f'POST /api/entries [{label}]', post_entry, args.requests, args.threads)
+        run(f'GET  /api/entries [{label}]', get_entries, args.requests, args.threads)
+    server.get_db = pooled_get_db
+
+
+def bench_writes(args):
+    headers = make_user()
+    entry_ids = []
+
+    def post_entry(client):
+        resp = client.post('/api/entries', json={'text': 'A hopeful, calm morning', 'mood': 'calm'}, headers=headers)
+        entry_ids.append(resp.get_json()['entry']['id'])
+        return resp
+
+    def put_profile(client):
+        return client.put('/api/auth/me', json={'bio': 'benchmarking', 'location': 'here'}, headers=headers)
+
+    def delete_entry(client):
+        return client.delete(f'/api/entries/{entry_ids.pop()}', headers=headers)
+
+    supported = db.SUPPORTS_RETURNING
+    modes = [('RETURNING', True), ('write + SELECT', False)] if supported else [('write + SELECT', False)]
+    for label, returning in modes:
+        server.SUPPORTS_RETURNING = returning
+        run(f'POST   /api/entries [{label}]', post_entry, args.requests, args.threads)
+        run(f'PUT    /api/auth/me [{label}]', put_profile, args.requests, args.threads)
+        run(f'DELETE /api/entries [{label}]', delete_entry, args.requests, args.threads)
+    server.SUPPORTS_RETURNING = supported
+    if supported:
+        bench_write_statements(args)
+
+
+def time_statements(fn, total):
+    start = time.perf_counter()
+    for i in range(total):
+        fn(i)
+    return time.perf_counter() - start
+
+
+def bench_write_statements(args):
+    # The same statements as the write routes, without Flask, JSON or the
+    # commit (each run is one transaction, rolled back), so whatever
+    # RETURNING changes is not lost in the rest of the request
+    with server.app.app_context():
+        user_id = db.get_db().execute('SELECT id FROM users WHERE email=?', ('bench@example.com',)).fetchone()['id']
+    conn = sqlite3.connect(db.DB, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    insert = 'INSERT INTO entries (user_id,text,mood,sentiment,createdAt,created_ms) VALUES (?,?,?,?,?,?)'
+    values = (user_id, 'A hopeful, calm morning', 'calm', 0.5, '2024-01-01T00:00:00', 0)
+    update = 'UPDATE users SET bio = ?, location = ? WHERE id = ?'
+
+    def insert_returning(i):
+        conn.execute(insert + ' RETURNING id,user_id,text,mood,sentiment,createdAt', values).fetchall()
+
+    def insert_select(i):
+        cur = conn.execute(insert, values)
+        conn.execute('SELECT id,user_id,text,mood,sentiment,createdAt FROM entries WHERE id=?',
+                     (cur.lastrowid,)).fetchone()
+
+    def update_returning(i):
+        conn.execute(f'{update} RETURNING {server.USER_PROFILE_COLUMNS}', (f'bio {i}', 'here', user_id)).fetchall()
+
+    def update_select(i):
+        conn.execute(update, (f'bio {i}', 'here', user_id))
+        conn.execute(f'SELECT {server.USER_PROFILE_COLUMNS} FROM users WHERE id=?', (user_id,)).fetchone()
+
+    def delete_returning(i):
+        conn.execute('DELETE FROM entries WHERE id = ? AND user_id = ? RETURNING mood, sentiment, createdAt',
+                     (ids[i], user_id)).fetchall()
+
+    def delete_select(i):
+        conn.execute('SELECT mood, sentiment, createdAt FROM entries WHERE id = ? AND user_id = ?',
+                     (ids[i], user_id)).fetchone()
+        conn.execute('DELETE FROM entries WHERE id = ? AND user_id = ?', (ids[i], user_id))
+
+    for name, returning, select in (('INSERT entry', insert_returning, insert_select),
+                                    ('UPDATE profile', update_returning, update_select),
+                                    ('DELETE entry', delete_returning, delete_select)):
+        # Alternated, best of five, so neither side gets the cold cache
+        best = {}
+        for _ in range(5):
+            for label, fn in (('write + SELECT', select), ('RETURNING', returning)):
+                conn.execute('BEGIN')
+                ids = [conn.execute(insert, values).lastrowid for _ in range(args.requests)]
+                best[label] = min(best.get(label, float('inf')), time_statements(fn, args.requests))
+                conn.execute('ROLLBACK')
+        for label, seconds in best.items():
+            print(f"{name + ' [' + label + ']':<40} {seconds / args.requests * 1e6:8.2f} us/op")
+    conn.close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the stub honours keep-alive like the real services do
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this Nagle's algorithm
+    # stalls every keep-alive response on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'success': True, 'reply': 'ok'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_calls(label, call, total, threads):
+    per_thread = max(1, total // threads)
+
+    def worker():
+        for _ in range(per_thread):
+            call().raise_for_status()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    done = per_thread * threads
+    print(f"{label:<40} {done / elapsed:10.1f} calls/s  {elapsed / done * 1000:6.3f} ms/call")
+
+
+def bench_http(args):
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{stub.server_address[1]}'
+    client = http_client.ServiceClient('stub', base, pool_size=args.threads)
+    payload = {'message': 'hello'}
+
+    run_calls('requests.post (new connection)', lambda: requests.post(f'{base}/chat', json=payload, timeout=5),
+              args.requests, args.threads)
+    run_calls('ServiceClient (keep-alive pool)', lambda: client.post('/chat', json=payload),
+              args.requests, args.threads)
+    stub.shutdown()
+
+
+def legacy_sentiment(text, pos_words, neg_words):
+    # The original scorer: one substring scan of the whole text per lexicon word
+    t = (text or '').lower()
+    return sum(1 for w in pos_words if w in t) - sum(1 for w in neg_words if w in t)
+
+
+def bench_sentiment(args):
+    rng = random.Random(42)
+    filler = ('the day was long and i went for a walk then met some friends at the cafe '
+              'work felt busy but we finished early and cooked dinner together').split()
+    base_words = [w for w in sentiment.DEFAULT_LEXICON if ' ' not in w]
+    vocab = filler * 8 + base_words + ['not', 'very', 'really', ',', '.']
+
+    def make_text(words):
+        return ' '.join(rng.choice(vocab) for _ in range(words))
+
+    long_entries = [make_text(5000) for _ in range(20)]
+    corpus = [make_text(rng.randint(20, 150)) for _ in range(args.corpus)]
+
+    # A VADER-sized synthetic lexicon shows how each approach scales with lexicon size
+    big_terms = dict(sentiment.DEFAULT_LEXICON)
+    big_terms.update({f'word{i}': (1 if i % 2 else -1) for i in range(5000)})
+    lexicons = {
+        f'{len(sentiment.DEFAULT_LEXICON)} terms': sentiment.DEFAULT_LEXICON,
+        f'{len(big_terms)} terms': big_terms,
+    }
+
+    for lex_label, terms in lexicons.items():
+        pos = [t for t, w in terms.items() if w > 0]
+        neg = [t for t, w in terms.items() if w < 0]
+        compiled = sentiment.Lexicon(terms)
+        for data_label, texts in (('20 x 5000-word entries', long_entries),
+                                  (f'{len(corpus)}-entry corpus', corpus)):
+            for impl_label, fn in (('substring scan', lambda t: legacy_sentiment(t, pos, neg)),
+                                   ('token lexicon', compiled.score)):
+                start = time.perf_counter()
+                for text in texts:
+                    fn(text)
+                elapsed = time.perf_counter() - start
+                print(f"{lex_label:<12} {data_label:<24} {impl_label:<15} {elapsed * 1000:9.1f} ms  "
+                      f"({elapsed / len(texts) * 1e6:8.1f} us/entry)")
+
+
+def bench_serialize(args):
+    headers = make_user('serialize@example.com')
+    client = server.app.test_client()
+    words = 'walked to the park and felt calm then worked late feeling tired but hopeful'.split()
+    rng = random.Random(7)
+    entries = [{'text': ' '.join(rng.choice(words) for _ in range(60)), 'mood': rng.choice(['happy', 'calm', 'sad']),
+                'createdAt': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T12:00:00'} for i in range(2000)]
+    client.post('/api/entries/bulk', json=entries, headers=headers).get_json()
+
+    endpoints = [
+        ('GET /api/entries?limit=200', '/api/entries?limit=200'),
+        ('GET /api/entries/search?limit=200', '/api/entries/search?q=calm&limit=200'),
+        ('GET /api/stats/calendar', '/api/stats/calendar?from=2024-01-01&to=2024-12-31'),
+        ('GET /api/entries/export (2000 rows)', '/api/entries/export?format=ndjson'),
+    ]
+    providers = [('json', DefaultJSONProvider(server.app))]
+    if jsonio.OrjsonProvider is not None:
+        providers.append(('orjson', jsonio.OrjsonProvider(server.app)))
+    installed = server.app.json
+    for label, path in endpoints:
+        for name, provider in providers:
+            server.app.json = provider
+            # The export stream encodes its own lines, so swap that encoder too
+            jsonio_dumps = jsonio.dumps_bytes
+            if name == 'json':
+                jsonio.dumps_bytes = lambda obj: json.dumps(obj, ensure_ascii=False).encode('utf-8')
+            run(f'{label} [{name}]', lambda c: c.get(path, headers=headers, buffered=True), args.requests, args.threads)
+            jsonio.dumps_bytes = jsonio_dumps
+    server.app.json = installed
+
+
+def bench_login(args):
+    # Every login here is the same client, so the limiter would refuse most of them
+    ratelimit.ENABLED = False
+    installed = passwords.hasher
+    modes = [('scrypt in request thread', 0), (f'scrypt in pool of {args.hash_workers}', args.hash_workers)]
+    print(f"scrypt n={args.scrypt_n} r={args.scrypt_r} p=1")
+    for label, workers in modes:
+        passwords.hasher = passwords.PasswordHasher(n=args.scrypt_n, r=args.scrypt_r, p=1, workers=workers,
+                                                    max_pending=args.threads * 2)
+        email = f'login-{workers}@example.com'
+        make_user(email)
+        payload = {'email': email, 'password': 'bench'}
+        run(f'POST /api/auth/login [{label}]', lambda c: c.post('/api/auth/login', json=payload),
+            args.requests, args.threads)
+        passwords.hasher.shutdown()
+    passwords.hasher = installed
+    ratelimit.ENABLED = True
+
+
+BENCHMARKS = {
+    'db': bench_db,
+    'writes': bench_writes,
+    'http': bench_http,
+    'sentiment': bench_sentiment,
+    'serialize': bench_serialize,
+    'login': bench_login,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--corpus', type=int, default=100000)
+    parser.add_argument('--scrypt-n', type=int, default=passwords.SCRYPT_N)
+    parser.add_argument('--scrypt-r', type=int, default=passwords.SCRYPT_R)
+    parser.add_argument('--hash-workers', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args(argv)
+
+    server.init_db()
+    print(f"Database: {db.DB}")
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+# --- Response compression ---
+# Dynamic responses (JSON, HTML, CSV) above MIN_BYTES are compressed with the
+# best coding the client accepts. Streamed and file responses are left alone:
+# the export stream compresses itself, and static files are precompressed at
+# build time (see assets.py).
+
+MIN_BYTES = int(os.environ.get('MJ_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('MJ_COMPRESS_GZIP_LEVEL', 6))
+# Brotli's higher qualities are far too slow per request; 4-5 beats gzip -6 on both size and speed
+BROTLI_QUALITY = int(os.environ.get('MJ_COMPRESS_BROTLI_QUALITY', 5))
+
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/manifest+json',
+    'text/html', 'text/css', 'text/csv', 'text/plain', 'text/javascript', 'image/svg+xml',
+])
+
+
+def negotiate(available=ENCODINGS):
+    """The preferred content coding from `available` that the request accepts, or None."""
+    if not available:
+        return None
+    return request.accept_encodings.best_match(available)
+
+
+def compress(data, coding, static=False):
+    """Encode bytes; `static` selects the slow, maximum-ratio settings used for build-time precompression."""
+    if coding == 'br':
+        return brotli.compress(data, quality=11 if static else BROTLI_QUALITY)
+    if coding == 'gzip':
+        return gzip.compress(data, 9 if static else GZIP_LEVEL, mtime=0)
+    raise ValueError(f'Unsupported content coding: {coding}')
+
+
+def compress_response(response):
+    if (response.status_code < 200 or response.status_code >= 300 or response.status_code == 204
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < MIN_BYTES:
+        return response
+    coding = negotiate()
+    if coding is None:
+        return response
+
+    response.set_data(compress(response.get_data(), coding))
+    response.headers['Content-Encoding'] = coding
+    # A strong ETag names exact bytes, so each coding needs its own
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{coding}')
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
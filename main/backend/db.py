@@ -0,0 +1,125 @@
+import datetime
+import os
+import queue
+import sqlite3
+
+from flask import g
+
+import metrics
+
+# --- Database Configuration ---
+DB = os.environ.get('MJ_DB', os.path.join(os.path.dirname(__file__), 'mood_journal.db'))
+POOL_SIZE = int(os.environ.get('MJ_DB_POOL_SIZE', 8))
+BUSY_TIMEOUT_MS = int(os.environ.get('MJ_DB_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KB = int(os.environ.get('MJ_DB_CACHE_KB', 16384))
+MMAP_SIZE = int(os.environ.get('MJ_DB_MMAP_BYTES', 128 * 1024 * 1024))
+
+# INSERT/UPDATE/DELETE ... RETURNING needs SQLite 3.35+; older builds fall back
+# to a follow-up SELECT.
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+class ConnectionPool:
+    """A small LIFO pool of tuned SQLite connections shared across request threads.
+
+    Connections are opened lazily. When every pooled connection is checked out a
+    temporary one is opened instead of blocking, and closed again on release if
+    the pool is already full.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000.0, check_same_thread=False,
+                               factory=metrics.TimedConnection if metrics.ENABLED else sqlite3.Connection)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run alongside a single writer instead of taking the
+        # whole file lock, which is what produced "database is locked" before.
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _after_fork(self):
+        # A SQLite connection must not be used across fork(); the child simply
+        # forgets the inherited ones and opens its own.
+        self._idle = queue.LifoQueue(maxsize=self.size)
+
+
+pool = ConnectionPool(DB)
+# Only gunicorn forks workers, and that is Unix-only; Windows has no fork hooks
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: pool._after_fork())
+metrics.Gauge('mj_db_pool_idle_connections', 'Pooled SQLite connections not checked out.',
+              collect=lambda: {(): pool._idle.qsize()})
+
+
+# --- Timestamp helpers ---
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_epoch_ms(dt):
+    """Convert a naive UTC datetime to integer epoch milliseconds (the created_ms columns)."""
+    return (dt - _EPOCH) // datetime.timedelta(milliseconds=1)
+
+
+def utc_now():
+    """Return the current time as a (createdAt ISO string, created_ms) pair."""
+    now = datetime.datetime.utcnow()
+    return now.isoformat(), to_epoch_ms(now)
+
+
+# --- Request-scoped access ---
+def get_db():
+    """Return the connection for the current app context, checking one out on first use."""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def tuple_cursor(conn):
+    """A cursor returning plain tuples instead of sqlite3.Row, for rows that are serialized as-is."""
+    cur = conn.cursor()
+    cur.row_factory = None
+    return cur
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -1,4 +1,6 @@
-from flask import Flask, request, jsonify
+import json
+
+from flask import Flask, Response, request, jsonify
 import google.generativeai as genai
 from flask_cors import CORS
 
@@ -22,5 +24,37 @@ def chat_api():
     except Exception as e:
         return jsonify({"reply": f"Error: {e}"}), 500
 
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream_api():
+    # Newline-delimited JSON: {"text": ...} per chunk as Gemini produces it,
+    # or a final {"error": ...}. The server relays these to the browser as SSE.
+    data = request.get_json()
+    message = data.get("message", "")
+    if not message:
+        return jsonify({"reply": "No message received."}), 400
+
+    def generate():
+        response = None
+        finished = False
+        try:
+            response = chat.send_message(message, stream=True)
+            for chunk in response:
+                # Each yield blocks until the client has taken the previous
+                # line; if it went away, the generator is closed here and
+                # Gemini is not read any further.
+                yield json.dumps({"text": chunk.text}) + "\n"
+            finished = True
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            if response is not None and not finished:
+                # Drop the half-received turn so the chat history stays usable
+                try:
+                    chat.rewind()
+                except Exception:
+                    pass
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
 if __name__ == "__main__":
     app.run(port=5001, debug=True)
@@ -0,0 +1,58 @@
+# --- Gunicorn settings for `python -m backend serve` ---
+# Every value can be overridden from the environment (MJ_*) or on the
+# command line; see launcher.py.
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+bind = os.environ.get('MJ_BIND', '0.0.0.0:5000')
+
+# Threaded workers: most request time is spent waiting on SQLite or on the
+# downstream services, so a few threads per process keep each core busy.
+# The ASGI mode (--asgi) runs one event loop per core instead.
+# (launcher.DrainingThreadWorker is gthread with a clean shutdown; see launcher.py)
+worker_class = os.environ.get('MJ_WORKER_CLASS', 'launcher.DrainingThreadWorker')
+workers = int(os.environ.get('MJ_WORKERS', 2 * cores + 1))
+threads = int(os.environ.get('MJ_THREADS', 4))
+
+# Each worker gets its own password-hashing pool (passwords.py); with one
+# worker per core already, one scrypt process each is plenty
+os.environ.setdefault('MJ_HASH_WORKERS', '1')
+
+# Load the app once in the master; workers fork from it and share its
+# memory copy-on-write. (A code change therefore needs `python -m backend
+# reload`, not just SIGHUP.)
+preload_app = True
+
+# Chat calls may take 20 s plus a retry
+timeout = int(os.environ.get('MJ_WORKER_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('MJ_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot build up; the jitter
+# keeps them from all restarting at once
+max_requests = int(os.environ.get('MJ_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+pidfile = os.environ.get('MJ_PIDFILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.pid'))
+accesslog = os.environ.get('MJ_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def on_starting(arbiter):
+    # Runs once, in the master, before any worker exists
+    import db
+    import server
+    server.init_db()
+    # Nothing opened here may leak into the workers
+    db.pool.close_all()
+
+
+def post_fork(arbiter, worker):
+    # Background threads do not survive fork(); each worker starts its own.
+    # Outbox claims are transactional, so several dispatchers are safe.
+    import outbox
+    import personality
+    outbox.start_dispatcher()
+    personality.start_worker()
@@ -0,0 +1,350 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+import metrics
+
+try:
+    import httpx
+except ImportError:  # Only needed for the ASGI mode (asgi.py)
+    httpx = None
+
+
+# A transport error on one of these may be retried even after the request was
+# sent; for the rest (POST: email, chat) only a failure to connect is retried
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+    def __init__(self, service, retry_after):
+        super().__init__(f"{service} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a rolling error-rate window.
+
+    Outcomes are counted in one-second buckets covering the last `window`
+    seconds. Once at least `min_requests` calls have been seen and the failure
+    ratio reaches `error_threshold`, the circuit opens and calls are rejected
+    for `cooldown` seconds. After that a single probe call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, window=30, min_requests=5, error_threshold=0.5, cooldown=15):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._buckets = deque()  # [second, total, failures]
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        horizon = int(now) - self.window
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self._buckets.popleft()
+
+    def _totals(self):
+        return sum(b[1] for b in self._buckets), sum(b[2] for b in self._buckets)
+
+    def _trip(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        self._buckets.clear()
+
+    def retry_after(self, now=None):
+        if self.state != self.OPEN:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.opened_at + self.cooldown - now)
+
+    def allow(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self.state = self.CLOSED
+                    self.opened_at = None
+                else:
+                    self._trip(now)
+                return
+            second = int(now)
+            if self._buckets and self._buckets[-1][0] == second:
+                bucket = self._buckets[-1]
+            else:
+                bucket = [second, 0, 0]
+                self._buckets.append(bucket)
+            bucket[1] += 1
+            if not ok:
+                bucket[2] += 1
+            self._prune(now)
+            total, failures = self._totals()
+            if self.state == self.CLOSED and total >= self.min_requests \
+                    and failures / total >= self.error_threshold:
+                self._trip(now)
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            total, failures = self._totals()
+            return {
+                'state': self.state,
+                'requests': total,
+                'failures': failures,
+                'error_rate': round(failures / total, 3) if total else 0.0,
+                'retry_after': round(self.retry_after(now), 1),
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+
+class ServiceClient:
+    """A keep-alive HTTP client for one downstream service.
+
+    Each service gets its own requests.Session with a sized connection pool,
+    so repeated calls reuse TCP connections instead of opening a new one per
+    request. Failures to connect (nothing reached the service) are retried with
+    jittered exponential backoff. A connection that breaks after the request
+    went out is only retried for IDEMPOTENT_METHODS, and HTTP statuses only
+    when listed in `retry_statuses`, since the email and chat calls are not
+    idempotent.
+
+    Every call goes through a CircuitBreaker: transport errors and 5xx responses
+    count as failures, and while the circuit is open calls raise
+    CircuitOpenError immediately instead of tying up a worker thread.
+    """
+
+    def __init__(self, name, base_url, timeout=10, retries=1, backoff=0.2,
+                 pool_size=10, retry_statuses=(), connect_timeout=3, breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_env(cls, name, default_url, **defaults):
+        """Build a client whose settings can be overridden with MJ_<NAME>_* environment variables."""
+        prefix = f'MJ_{name.upper()}_'
+        env = os.environ.get
+        breaker = CircuitBreaker(
+            window=int(env(prefix + 'BREAKER_WINDOW', 30)),
+            min_requests=int(env(prefix + 'BREAKER_MIN_REQUESTS', 5)),
+            error_threshold=float(env(prefix + 'BREAKER_THRESHOLD', 0.5)),
+            cooldown=float(env(prefix + 'BREAKER_COOLDOWN', 15)),
+        )
+        return cls(
+            name,
+            env(prefix + 'URL', default_url),
+            timeout=float(env(prefix + 'TIMEOUT', defaults.pop('timeout', 10))),
+            connect_timeout=float(env(prefix + 'CONNECT_TIMEOUT', defaults.pop('connect_timeout', 3))),
+            retries=int(env(prefix + 'RETRIES', defaults.pop('retries', 1))),
+            backoff=float(env(prefix + 'BACKOFF', defaults.pop('backoff', 0.2))),
+            pool_size=int(env(prefix + 'POOL_SIZE', defaults.pop('pool_size', 10))),
+            breaker=breaker,
+            **defaults
+        )
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _sleep(self, attempt):
+        # "Full jitter": a random delay up to the exponential cap
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method, path, timeout=None, **kwargs):
+        if not self.breaker.allow():
+            metrics.observe_downstream(self.name, 'circuit_open', 0.0)
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+        ok = False
+        outcome = 'error'
+        start = time.perf_counter()
+        try:
+            response = self._send(method, path, timeout, **kwargs)
+            ok = response.status_code < 500
+            outcome = f'{response.status_code // 100}xx'
+            return response
+        finally:
+            self.breaker.record(ok)
+            metrics.observe_downstream(self.name, outcome, time.perf_counter() - start)
+
+    def _send(self, method, path, timeout, **kwargs):
+        # A short connect timeout keeps a dead host from costing the full read timeout
+        timeout = (self.connect_timeout, self.timeout if timeout is None else timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # A read timeout (not a ConnectionError) or a dropped connection
+                # means the service may already be acting on the request
+                if attempt >= self.retries or not (method in IDEMPOTENT_METHODS or _connect_failed(e)):
+                    raise
+            else:
+                if response.status_code not in self.retry_statuses or attempt >= self.retries:
+                    return response
+                response.close()
+            self._sleep(attempt)
+            attempt += 1
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+
+def _connect_failed(error):
+    # requests wraps urllib3's MaxRetryError, whose reason says which phase failed
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return (isinstance(error, requests.exceptions.ConnectTimeout)
+            or isinstance(reason, (NewConnectionError, ConnectTimeoutError)))
+
+
+class AsyncServiceClient:
+    """The asyncio counterpart of a ServiceClient, used by the ASGI mode.
+
+    It reuses the sync client's settings and, importantly, its CircuitBreaker,
+    so both serving modes see one view of a service's health. The underlying
+    httpx.AsyncClient (a keep-alive pool of up to `max_connections`) is
+    created on first use, inside the running event loop.
+    """
+
+    def __init__(self, sync_client, max_connections=100):
+        self.sync_client = sync_client
+        self.name = sync_client.name
+        self.breaker = sync_client.breaker
+        self.max_connections = max_connections
+        self._client = None
+
+    @classmethod
+    def from_sync(cls, sync_client):
+        prefix = f'MJ_{sync_client.name.upper()}_'
+        return cls(sync_client, max_connections=int(os.environ.get(prefix + 'ASYNC_MAX_CONNECTIONS', 100)))
+
+    def client(self):
+        if self._client is None:
+            if httpx is None:
+                raise RuntimeError('The ASGI mode needs the httpx package')
+            self._client = httpx.AsyncClient(
+                base_url=self.sync_client.base_url,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def request(self, method, path, timeout=None, **kwargs):
+        if not self.breaker.allow():
+            metrics.observe_downstream(self.name, 'circuit_open', 0.0)
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+        ok = False
+        outcome = 'error'
+        start = time.perf_counter()
+        try:
+            response = await self._send(method, path, timeout, **kwargs)
+            ok = response.status_code < 500
+            outcome = f'{response.status_code // 100}xx'
+            return response
+        finally:
+            self.breaker.record(ok)
+            metrics.observe_downstream(self.name, outcome, time.perf_counter() - start)
+
+    async def _send(self, method, path, timeout, stream=False, **kwargs):
+        # stream=True returns as soon as the headers arrive; the caller reads
+        # the body with aiter_lines()/aiter_bytes() and must aclose() it
+        sync = self.sync_client
+        timeout = httpx.Timeout(sync.timeout if timeout is None else timeout, connect=sync.connect_timeout)
+        attempt = 0
+        while True:
+            try:
+                client = self.client()
+                request = client.build_request(method, '/' + path.lstrip('/'), timeout=timeout, **kwargs)
+                response = await client.send(request, stream=stream)
+            except (httpx.NetworkError, httpx.RemoteProtocolError, httpx.ConnectTimeout) as e:
+                # Same rule as the sync client: failures to connect are retried,
+                # a connection lost mid-request only for idempotent methods
+                connect_failed = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if attempt >= sync.retries or not (method in IDEMPOTENT_METHODS or connect_failed):
+                    raise
+            else:
+                if response.status_code not in sync.retry_statuses or attempt >= sync.retries:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(random.uniform(0, sync.backoff * (2 ** attempt)))
+            attempt += 1
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# --- Downstream services ---
+# The personality analyzer is a pure function of its input, so it is also safe
+# to retry on gateway errors.
+analyzer = ServiceClient.from_env('analyzer', 'http://127.0.0.1:5003', timeout=15, retries=2,
+                                  retry_statuses=(502, 503, 504))
+chat = ServiceClient.from_env('chat', 'http://127.0.0.1:5001', timeout=20, retries=1)
+email = ServiceClient.from_env('email', os.environ.get('EMAIL_SERVICE_URL', 'http://127.0.0.1:3000'),
+                               timeout=10, retries=1)
+
+SERVICES = (analyzer, chat, email)
+
+# Async counterparts for asgi.py; they share the breakers above
+async_analyzer = AsyncServiceClient.from_sync(analyzer)
+async_chat = AsyncServiceClient.from_sync(chat)
+async_email = AsyncServiceClient.from_sync(email)
+ASYNC_SERVICES = (async_analyzer, async_chat, async_email)
+
+_BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+metrics.Gauge('mj_circuit_state', 'Circuit breaker state per service (0 closed, 1 half-open, 2 open).', ('service',),
+              collect=lambda: {(svc.name,): _BREAKER_STATES[svc.breaker.state] for svc in SERVICES})
@@ -0,0 +1,66 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder is used instead
+    orjson = None
+
+# --- JSON encoding for API responses ---
+# With orjson installed, jsonify() and request.get_json() go through it and
+# responses are built straight from the encoded bytes. Without it Flask's
+# stdlib provider is used unchanged.
+
+
+def rows_to_objects(rows, fields):
+    """Turn plain tuple rows (see db.tuple_cursor) into JSON objects for the first len(fields) columns."""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson.
+
+        Output is always UTF-8 and keys keep their insertion order (sort_keys
+        is off; set it to True to sort). Types orjson does not know fall back
+        to Flask's own `default` (Decimal, UUID, dataclasses, ...).
+        """
+
+        sort_keys = False
+
+        def _options(self, pretty=False):
+            option = orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            return option
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default, option=self._options(kwargs.get('indent'))).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            pretty = self.compact is False or (self.compact is None and self._app.debug)
+            body = orjson.dumps(obj, default=self.default, option=self._options(pretty)) + b'\n'
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+else:
+    OrjsonProvider = None
+
+    def dumps_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def init_app(app):
+    """Install the fastest available JSON provider on the app; returns its name."""
+    if OrjsonProvider is not None:
+        app.json = OrjsonProvider(app)
+        return 'orjson'
+    return 'json'
@@ -0,0 +1,181 @@
+"""Production launcher: gunicorn workers forked from a preloaded app.
+
+Run from the `main` directory:
+
+    python -m backend serve                 # threaded WSGI workers (server.py)
+    python -m backend serve --asgi          # uvicorn workers (asgi.py)
+    python -m backend serve --workers 4 --threads 8 --bind 127.0.0.1:5000
+    python -m backend reload                # zero-downtime code reload
+
+Settings come from gunicorn.conf.py (or --config), then MJ_* environment
+variables, then these flags. The database is migrated once, in the master,
+before the workers are forked.
+
+Signals to the master (pid in MJ_PIDFILE) work as usual: HUP re-reads the
+config and gracefully replaces the workers, TTIN/TTOU add or remove one,
+TERM shuts down gracefully. Because the app is preloaded, HUP does not pick
+up new code; `reload` does that by starting a new master alongside the old
+one (USR2) and then retiring the old one. The default worker class,
+DrainingThreadWorker below, stops accepting as soon as it is told to exit,
+so connections arriving during the handover go to the new master's workers.
+
+gunicorn (and, for --asgi, uvicorn) are pinned in requirements.txt.
+"""
+import argparse
+import multiprocessing
+import os
+import runpy
+import signal
+import sys
+import time
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.workers.gthread import ThreadWorker
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG = os.path.join(BACKEND_DIR, 'gunicorn.conf.py')
+
+
+class DrainingThreadWorker(ThreadWorker):
+    """The gthread worker, but SIGTERM stops accepting before it stops serving.
+
+    Stock gthread leaves its loop as soon as TERM arrives and drops sockets it
+    has accepted but not read yet, which showed up as empty replies during a
+    reload. This one unregisters the listeners at once (the kernel hands new
+    connections to the other workers, e.g. the new master's) and exits when
+    its remaining connections are done or graceful_timeout has passed.
+    """
+
+    _drain_until = None
+
+    def handle_exit(self, sig, frame):
+        if self._drain_until is not None:
+            return
+        self._drain_until = time.monotonic() + self.cfg.graceful_timeout
+        for sock in self.sockets:
+            try:
+                self.poller.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+
+    def is_parent_alive(self):
+        if self._drain_until is not None and (self.nr_conns == 0 or time.monotonic() > self._drain_until):
+            return False
+        return super().is_parent_alive()
+
+
+class Launcher(BaseApplication):
+    def __init__(self, config_path, overrides, asgi=False):
+        self.config_path = config_path
+        self.overrides = overrides
+        self.asgi = asgi
+        super().__init__()
+
+    def load_config(self):
+        # Same rules as gunicorn's own -c: names that are not settings are ignored
+        for key, value in runpy.run_path(self.config_path).items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+        for key, value in self.overrides.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Called in the master (preload_app), so workers inherit a ready app
+        if self.asgi:
+            import asgi
+            return asgi.app
+        import server
+        return server.app
+
+
+def serve(args):
+    overrides = {}
+    if args.asgi:
+        overrides['worker_class'] = 'uvicorn.workers.UvicornWorker'
+        # One event loop per core already handles many concurrent requests
+        if not args.workers and 'MJ_WORKERS' not in os.environ:
+            overrides['workers'] = multiprocessing.cpu_count()
+    for key in ('bind', 'workers', 'threads'):
+        if getattr(args, key):
+            overrides[key] = getattr(args, key)
+    Launcher(args.config, overrides, asgi=args.asgi).run()
+
+
+def _read_pid(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _alive(pid):
+    # kill(0, ...) would signal our own process group
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def _wait_for(check, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def reload(args):
+    """Start a new master with fresh code next to the old one, then retire the old one gracefully."""
+    pidfile = runpy.run_path(args.config).get('pidfile')
+    old = _read_pid(pidfile) if pidfile else 0
+    if not old or not _alive(old):
+        sys.exit(f"No running server found (pidfile: {pidfile})")
+
+    # The re-executed master writes <pidfile>.2 while the old one is alive and
+    # renames it to <pidfile> once the old one has exited
+    print(f"Starting a new master next to {old}...")
+    os.kill(old, signal.SIGUSR2)
+    if not _wait_for(lambda: _alive(_read_pid(pidfile + '.2')), args.timeout):
+        sys.exit("New master did not come up; the old one is still serving")
+    new = _read_pid(pidfile + '.2')
+
+    # Give the new workers a moment to boot before the old ones stop accepting
+    time.sleep(args.warmup)
+    os.kill(old, signal.SIGTERM)
+    print(f"New master {new} is serving; waiting for {old} to drain...")
+    if not _wait_for(lambda: _read_pid(pidfile) == new, args.timeout):
+        sys.exit(f"Old master {old} has not exited yet; {new} is serving alongside it")
+    print(f"Reloaded: master {new}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backend', description=__doc__.split('\n')[0])
+    parser.add_argument('-c', '--config', default=os.environ.get('MJ_GUNICORN_CONFIG', DEFAULT_CONFIG))
+    commands = parser.add_subparsers(dest='command')
+
+    serve_cmd = commands.add_parser('serve', help='run the API with gunicorn')
+    serve_cmd.add_argument('--asgi', action='store_true', help='serve asgi.py with uvicorn workers')
+    serve_cmd.add_argument('--bind')
+    serve_cmd.add_argument('--workers', type=int)
+    serve_cmd.add_argument('--threads', type=int)
+
+    reload_cmd = commands.add_parser('reload', help='zero-downtime code reload of a running server')
+    reload_cmd.add_argument('--timeout', type=float, default=60)
+    reload_cmd.add_argument('--warmup', type=float, default=2)
+
+    args = parser.parse_args(argv)
+    if args.command == 'reload':
+        reload(args)
+    else:
+        if args.command is None:
+            args = parser.parse_args(['serve'] + (argv if argv is not None else sys.argv[1:]))
+        serve(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+import bisect
+import hmac
+import ipaddress
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Response, g, jsonify, request
+
+# --- Metrics ---
+# A small in-process registry rendered in the Prometheus text exposition
+# format on /metrics. Every request is timed per route; SQLite statements and
+# downstream HTTP calls are timed separately, and each response also carries a
+# Server-Timing header with its own db/http/total split.
+# Numbers are per process: with several workers, scrape each one.
+#
+# The app listens on every interface, so /metrics is not public: scrapers
+# send MJ_METRICS_TOKEN as a bearer token, or, when no token is set, must
+# connect from the same host. A request relayed by a local reverse proxy
+# carries X-Forwarded-For and does not count as local.
+
+ENABLED = os.environ.get('MJ_METRICS', '1') == '1'
+TOKEN = os.environ.get('MJ_METRICS_TOKEN')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or read from `collect()` (returning {labels: value}) at scrape time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        if self.collect is not None:
+            values = self.collect()
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, ([*s[0]], s[1], s[2])) for labels, s in self._values.items())
+        for labels, (counts, total, count) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                running += n
+                le = (('le', _number(bound)),)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {running}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- HTTP requests ---
+http_requests = Counter('mj_http_requests_total', 'Requests handled, by route and status.',
+                        ('method', 'route', 'status'))
+http_latency = Histogram('mj_http_request_duration_seconds', 'Time to produce a response, by route.',
+                         ('method', 'route'))
+http_in_flight = Gauge('mj_http_requests_in_flight', 'Requests currently being handled.')
+
+# --- SQLite ---
+db_queries = Histogram('mj_db_query_duration_seconds', 'SQLite execute() time, by statement type.',
+                       ('operation',), buckets=QUERY_BUCKETS)
+db_fetch_seconds = Counter('mj_db_fetch_seconds_total', 'Time spent fetching SQLite result rows.')
+
+# --- Downstream services ---
+downstream_latency = Histogram('mj_downstream_request_duration_seconds',
+                               'Calls to downstream services, including retries, by outcome.',
+                               ('service', 'outcome'))
+
+# --- Streamed responses (/api/chat/stream) ---
+stream_first_token = Histogram('mj_stream_first_token_seconds',
+                               'Time from the request arriving to the first token sent to the client.', ('route',))
+stream_duration = Histogram('mj_stream_duration_seconds', 'Time from the request arriving to the end of the stream.',
+                            ('route', 'outcome'), buckets=LATENCY_BUCKETS + (30.0, 60.0))
+
+# Per-request totals behind the Server-Timing header; None outside a request
+_timings = ContextVar('mj_request_timings', default=None)
+
+_OPERATIONS = frozenset(['select', 'insert', 'update', 'delete', 'with', 'begin', 'commit', 'rollback', 'pragma'])
+
+
+def _operation(sql):
+    word = sql.lstrip()[:8].split(None, 1)
+    word = word[0].lower() if word else ''
+    return word if word in _OPERATIONS else 'other'
+
+
+def _add_timing(key, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings[key] += seconds
+
+
+def observe_query(sql, seconds):
+    db_queries.observe(seconds, _operation(sql))
+    _add_timing('db', seconds)
+
+
+def observe_fetch(seconds):
+    db_fetch_seconds.inc(amount=seconds)
+    _add_timing('db', seconds)
+
+
+def observe_downstream(service, outcome, seconds):
+    downstream_latency.observe(seconds, service, outcome)
+    _add_timing('http', seconds)
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            observe_query(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            observe_fetch(time.perf_counter() - start)
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            observe_fetch(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            observe_fetch(time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors (including those behind conn.execute) record query timings."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            observe_query('COMMIT', time.perf_counter() - start)
+
+
+# --- Per-request recording (shared by the Flask hooks and asgi.py) ---
+def start_request():
+    """Begin timing a request in the current context; returns its start time."""
+    _timings.set({'db': 0.0, 'http': 0.0})
+    http_in_flight.inc()
+    return time.perf_counter()
+
+
+def observe_request(method, route, status, elapsed):
+    http_requests.inc(method, route, str(status))
+    http_latency.observe(elapsed, method, route)
+
+
+def server_timing(elapsed):
+    """The Server-Timing header value for the current request, or None outside one."""
+    timings = _timings.get()
+    if timings is None:
+        return None
+    return f"db;dur={timings['db'] * 1000:.2f}, http;dur={timings['http'] * 1000:.2f}, total;dur={elapsed * 1000:.2f}"
+
+
+def finish_request():
+    http_in_flight.dec()
+    _timings.set(None)
+
+
+# --- Flask hooks ---
+def _route():
+    return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+
+def _start_request():
+    g.metrics_start = start_request()
+
+
+def _record_request(response):
+    start = g.get('metrics_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    observe_request(request.method, _route(), response.status_code, elapsed)
+    timing = server_timing(elapsed)
+    if timing:
+        response.headers['Server-Timing'] = timing
+    g.metrics_recorded = True
+    return response
+
+
+def _finish_request(exc=None):
+    if g.get('metrics_start') is None:
+        return
+    if exc is not None and not g.get('metrics_recorded'):
+        observe_request(request.method, _route(), 500, time.perf_counter() - g.metrics_start)
+    finish_request()
+    g.metrics_start = None
+
+
+def may_scrape():
+    if TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {TOKEN}'.encode())
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+
+def metrics_view():
+    if not may_scrape():
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """Install the timing hooks and the /metrics route (no-op when MJ_METRICS=0)."""
+    if not ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
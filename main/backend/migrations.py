@@ -0,0 +1,252 @@
+import datetime
+import sqlite3
+
+# --- Schema Migrations ---
+# Each migration is (version, name, function). They run in order, each inside
+# its own transaction, and the applied version is recorded in `schema_version`
+# so a boot only does work when there is something new to apply.
+# Never edit a migration that has shipped; add a new one instead.
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_columns(conn, table, columns):
+    existing = _columns(conn, table)
+    for col, data_type in columns.items():
+        if col not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {data_type}")
+
+
+def m001_base_tables(conn):
+    # The 'is_verified' column is crucial for the email verification flow
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE,
+        password TEXT,
+        is_verified BOOLEAN DEFAULT 0,
+        createdAt TEXT
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        text TEXT,
+        mood TEXT,
+        sentiment REAL,
+        createdAt TEXT
+    )''')
+    # Databases created before is_verified existed
+    _add_columns(conn, 'users', {'is_verified': 'BOOLEAN DEFAULT 0'})
+
+
+def m002_user_profile_columns(conn):
+    _add_columns(conn, 'users', {
+        'avatar': 'TEXT',
+        'full_name': 'TEXT',
+        'bio': 'TEXT',
+        'location': 'TEXT',
+        'interests': 'TEXT',  # Stored as JSON string
+        'date_of_birth': 'TEXT',
+        'oauth_provider': 'TEXT',
+        'oauth_id': 'TEXT'
+    })
+
+
+def m003_entry_indexes(conn):
+    # Every per-user query filters on user_id and then orders or ranges on
+    # createdAt (listing, weekly stats) or id (personality, delete).
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_user_created ON entries (user_id, createdAt)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_user_id ON entries (user_id, id)')
+
+
+def m004_created_ms(conn):
+    # createdAt stays the ISO string the API returns; created_ms is the sortable
+    # copy. ORDER BY datetime(createdAt) could never use an index.
+    for table in ('users', 'entries'):
+        _add_columns(conn, table, {'created_ms': 'INTEGER'})
+        conn.execute(f'''UPDATE {table}
+            SET created_ms = CAST(ROUND((julianday(createdAt) - 2440587.5) * 86400000) AS INTEGER)
+            WHERE created_ms IS NULL AND createdAt IS NOT NULL''')
+        # Safety net for rows inserted by tools that only set createdAt
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_created_ms
+            AFTER INSERT ON {table}
+            WHEN NEW.created_ms IS NULL AND NEW.createdAt IS NOT NULL
+            BEGIN
+                UPDATE {table}
+                SET created_ms = CAST(ROUND((julianday(NEW.createdAt) - 2440587.5) * 86400000) AS INTEGER)
+                WHERE id = NEW.id;
+            END''')
+    # The rowid is implicitly the last key column, so this also orders ties by id
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_user_created_ms ON entries (user_id, created_ms)')
+    conn.execute('DROP INDEX IF EXISTS idx_entries_user_created')
+
+
+def m005_mood_daily(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS mood_daily (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        mood TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        sentiment_sum REAL NOT NULL DEFAULT 0,
+        sentiment_min REAL,
+        sentiment_max REAL,
+        PRIMARY KEY (user_id, day, mood)
+    ) WITHOUT ROWID''')
+    conn.execute('''INSERT OR REPLACE INTO mood_daily
+        (user_id, day, mood, count, sentiment_sum, sentiment_min, sentiment_max)
+        SELECT user_id, substr(createdAt, 1, 10), mood, COUNT(*), TOTAL(sentiment), MIN(sentiment), MAX(sentiment)
+        FROM entries WHERE createdAt IS NOT NULL AND mood IS NOT NULL
+        GROUP BY user_id, substr(createdAt, 1, 10), mood''')
+
+
+def m006_entries_fts(conn):
+    # External-content FTS5 index over entries.text, kept in sync by triggers.
+    # user_id is indexed too so a search can be scoped to one user's doclist
+    # inside the MATCH instead of filtering everyone's hits afterwards.
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+        text, user_id,
+        content='entries', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts (rowid, text, user_id) VALUES (NEW.id, NEW.text, NEW.user_id);
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, text, user_id) VALUES ('delete', OLD.id, OLD.text, OLD.user_id);
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS entries_fts_au AFTER UPDATE OF text, user_id ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, text, user_id) VALUES ('delete', OLD.id, OLD.text, OLD.user_id);
+        INSERT INTO entries_fts (rowid, text, user_id) VALUES (NEW.id, NEW.text, NEW.user_id);
+    END''')
+    conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+    # Rank on the journal text only; the user_id column is just a filter
+    conn.execute("INSERT INTO entries_fts (entries_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+
+
+def m007_email_outbox(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        email TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_ms INTEGER NOT NULL,
+        last_error TEXT,
+        created_ms INTEGER NOT NULL,
+        updated_ms INTEGER NOT NULL
+    )''')
+    # At most one queued or in-flight message per (kind, address): repeated
+    # "resend" clicks coalesce onto it instead of sending several codes.
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_email_outbox_active
+        ON email_outbox (kind, email) WHERE status IN ('pending', 'sending')''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+        ON email_outbox (status, next_attempt_ms)''')
+
+
+def m008_personality_cache(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS personality_cache (
+        user_id INTEGER PRIMARY KEY,
+        latest_entry_id INTEGER,
+        profile TEXT,
+        stale INTEGER NOT NULL DEFAULT 0,
+        computed_ms INTEGER NOT NULL
+    )''')
+
+
+
+def m009_revisions(conn):
+    # Per-user change counters used as ETag version stamps. Triggers keep them
+    # current for every writer, so a conditional GET only reads the users row.
+    _add_columns(conn, 'users', {
+        'entries_rev': 'INTEGER NOT NULL DEFAULT 0',
+        'profile_rev': 'INTEGER NOT NULL DEFAULT 0',
+    })
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_entries_rev_ai AFTER INSERT ON entries BEGIN
+        UPDATE users SET entries_rev = entries_rev + 1 WHERE id = NEW.user_id;
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_entries_rev_ad AFTER DELETE ON entries BEGIN
+        UPDATE users SET entries_rev = entries_rev + 1 WHERE id = OLD.user_id;
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_entries_rev_au AFTER UPDATE ON entries BEGIN
+        UPDATE users SET entries_rev = entries_rev + 1 WHERE id IN (OLD.user_id, NEW.user_id);
+    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_profile_rev
+        AFTER UPDATE OF email, is_verified, avatar, full_name, bio, location, interests, date_of_birth ON users
+        BEGIN
+            UPDATE users SET profile_rev = profile_rev + 1 WHERE id = NEW.id;
+        END''')
+
+
+def m010_rate_limits(conn):
+    # Token buckets shared by every worker when MJ_RATELIMIT_STORE=sqlite
+    conn.execute('''CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    ) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limits_updated ON rate_limits (updated)')
+
+
+def m011_search_snapshots(conn):
+    # Ranked id lists that keep a paged search stable while the index changes
+    conn.execute('''CREATE TABLE IF NOT EXISTS search_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        query TEXT NOT NULL,
+        ids TEXT NOT NULL,
+        created_ms INTEGER NOT NULL
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_search_snapshots_created ON search_snapshots (created_ms)')
+
+
+MIGRATIONS = [
+    (1, 'base_tables', m001_base_tables),
+    (2, 'user_profile_columns', m002_user_profile_columns),
+    (3, 'entry_indexes', m003_entry_indexes),
+    (4, 'created_ms', m004_created_ms),
+    (5, 'mood_daily', m005_mood_daily),
+    (6, 'entries_fts', m006_entries_fts),
+    (7, 'email_outbox', m007_email_outbox),
+    (8, 'personality_cache', m008_personality_cache),
+    (9, 'revisions', m009_revisions),
+    (10, 'rate_limits', m010_rate_limits),
+    (11, 'search_snapshots', m011_search_snapshots),
+]
+
+
+def current_version(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TEXT
+    )''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """Apply every pending migration and return the resulting schema version."""
+    version = current_version(conn)
+    for number, name, fn in MIGRATIONS:
+        if number <= version:
+            continue
+        # IMMEDIATE takes the write lock up front so two processes booting at
+        # once cannot both apply the same migration.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= number:
+                conn.rollback()
+                continue
+            print(f"Migrating DB: applying {number:03d}_{name}...")
+            fn(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, name, applied_at) VALUES (?,?,?)',
+                (number, name, datetime.datetime.utcnow().isoformat())
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        version = number
+    return version
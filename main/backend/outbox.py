@@ -0,0 +1,155 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import db
+import http_client
+
+# --- Durable email outbox ---
+# Handlers only insert a row into email_outbox (in their own transaction) and
+# return. A background dispatcher thread delivers queued messages through the
+# email service, retrying failures with backoff.
+
+VERIFICATION = 'verification'
+PASSWORD_RESET = 'password_reset'
+
+# Email service endpoint for each kind of message
+ENDPOINTS = {
+    VERIFICATION: '/send-verification-code',
+    PASSWORD_RESET: '/send-password-reset',
+}
+
+MAX_ATTEMPTS = int(os.environ.get('MJ_OUTBOX_MAX_ATTEMPTS', 8))
+BATCH_SIZE = int(os.environ.get('MJ_OUTBOX_BATCH_SIZE', 20))
+POLL_INTERVAL = float(os.environ.get('MJ_OUTBOX_POLL_INTERVAL', 2.0))
+BACKOFF_BASE_MS = 2000
+BACKOFF_MAX_MS = 10 * 60 * 1000
+STUCK_AFTER_MS = 5 * 60 * 1000  # 'sending' rows older than this are assumed abandoned
+KEEP_SENT_MS = 7 * 24 * 3600 * 1000
+
+_wakeup = threading.Event()
+_dispatcher = None
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def enqueue(conn, kind, email):
+    """Queue a message in the caller's transaction; a duplicate still waiting to go out is coalesced."""
+    now = _now_ms()
+    conn.execute('''INSERT INTO email_outbox (kind, email, status, next_attempt_ms, created_ms, updated_ms)
+        VALUES (?, ?, 'pending', ?, ?, ?)
+        ON CONFLICT (kind, email) WHERE status IN ('pending', 'sending') DO NOTHING''',
+        (kind, email, now, now, now))
+
+
+def notify():
+    """Wake the dispatcher so a freshly committed message goes out without waiting for the next poll."""
+    _wakeup.set()
+
+
+def backoff_ms(attempts):
+    cap = min(BACKOFF_MAX_MS, BACKOFF_BASE_MS * (2 ** max(0, attempts - 1)))
+    return random.randint(cap // 2, cap)
+
+
+def claim(conn, limit=BATCH_SIZE):
+    """Mark up to `limit` due messages as 'sending' and return them."""
+    now = _now_ms()
+    # An idle poll is a read off idx_email_outbox_due; the write lock is only
+    # taken when something is due
+    due = conn.execute('''SELECT 1 FROM email_outbox
+        WHERE status = 'pending' AND next_attempt_ms <= ? LIMIT 1''', (now,)).fetchone()
+    if due is None:
+        return []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute('''SELECT id, kind, email, attempts FROM email_outbox
+            WHERE status = 'pending' AND next_attempt_ms <= ?
+            ORDER BY next_attempt_ms LIMIT ?''', (now, limit)).fetchall()
+        conn.executemany('''UPDATE email_outbox SET status = 'sending', attempts = attempts + 1, updated_ms = ?
+            WHERE id = ?''', [(now, r['id']) for r in rows])
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return rows
+
+
+def deliver(conn, message):
+    attempts = message['attempts'] + 1
+    try:
+        response = http_client.email.post(ENDPOINTS[message['kind']], json={'email': message['email']})
+        response.raise_for_status()
+    except http_client.CircuitOpenError as e:
+        # Not the message's fault: wait out the breaker without using up an attempt
+        _reschedule(conn, message['id'], attempts - 1, int(e.retry_after * 1000) + 1, str(e))
+        return False
+    except Exception as e:
+        if attempts >= MAX_ATTEMPTS:
+            print(f"Outbox: giving up on {message['kind']} email to {message['email']}: {e}")
+            conn.execute("UPDATE email_outbox SET status = 'failed', last_error = ?, updated_ms = ? WHERE id = ?",
+                         (str(e), _now_ms(), message['id']))
+        else:
+            _reschedule(conn, message['id'], attempts, backoff_ms(attempts), str(e))
+        conn.commit()
+        return False
+    conn.execute("UPDATE email_outbox SET status = 'sent', last_error = NULL, updated_ms = ? WHERE id = ?",
+                 (_now_ms(), message['id']))
+    conn.commit()
+    return True
+
+
+def _reschedule(conn, message_id, attempts, delay_ms, error):
+    now = _now_ms()
+    conn.execute('''UPDATE email_outbox SET status = 'pending', attempts = ?, next_attempt_ms = ?,
+        last_error = ?, updated_ms = ? WHERE id = ?''', (attempts, now + delay_ms, error, now, message_id))
+    conn.commit()
+
+
+def recover(conn):
+    """Requeue messages left 'sending' by a process that died mid-delivery, and drop old sent ones."""
+    now = _now_ms()
+    conn.execute("UPDATE email_outbox SET status = 'pending', updated_ms = ? WHERE status = 'sending' AND updated_ms < ?",
+                 (now, now - STUCK_AFTER_MS))
+    conn.execute("DELETE FROM email_outbox WHERE status = 'sent' AND updated_ms < ?", (now - KEEP_SENT_MS,))
+    conn.commit()
+
+
+def run_once(conn):
+    """Deliver one batch of due messages; returns how many were claimed."""
+    batch = claim(conn)
+    for message in batch:
+        deliver(conn, message)
+    return len(batch)
+
+
+def _dispatch_forever():
+    conn = db.pool.acquire()
+    last_recover = 0.0
+    while True:
+        # Cleared before looking for work so a notify() during the batch is not lost
+        _wakeup.clear()
+        try:
+            if time.monotonic() - last_recover > 60:
+                recover(conn)
+                last_recover = time.monotonic()
+            if run_once(conn):
+                continue  # There may be more due right away
+        except Exception as e:
+            print(f"Outbox dispatcher error: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+        _wakeup.wait(POLL_INTERVAL)
+
+
+def start_dispatcher():
+    """Start the background dispatcher thread (once per process)."""
+    global _dispatcher
+    if _dispatcher is None or not _dispatcher.is_alive():
+        _dispatcher = threading.Thread(target=_dispatch_forever, name='email-outbox', daemon=True)
+        _dispatcher.start()
+    return _dispatcher
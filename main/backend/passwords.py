@@ -0,0 +1,179 @@
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+# --- Password hashing ---
+# Passwords are stored as scrypt$<n>$<r>$<p>$<salt>$<key> (base64 salt and
+# key). Accounts created before this module hold a bare SHA-256 hex digest;
+# those still verify, and are rehashed with scrypt on the next successful
+# login, as are hashes made with older cost parameters.
+#
+# Each scrypt call costs tens of milliseconds of CPU and n*r*128 bytes of
+# memory, so it runs in a small process pool instead of the request thread.
+# At most MJ_HASH_MAX_PENDING calls may wait for the pool; beyond that
+# HasherBusy is raised, which the routes answer with 503 rather than letting
+# a login burst pile up behind the KDF. Pool processes are started from a
+# forkserver (spawned on Windows, which has none), so a script that hashes
+# through the pool needs the usual `if __name__ == '__main__':` guard
+# (server.py and benchmark.py have one).
+
+SCRYPT_N = int(os.environ.get('MJ_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('MJ_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('MJ_SCRYPT_P', 1))
+# 0 hashes in the calling thread (tests, one-off scripts)
+WORKERS = int(os.environ.get('MJ_HASH_WORKERS', multiprocessing.cpu_count()))
+MAX_PENDING = int(os.environ.get('MJ_HASH_MAX_PENDING', 0)) or max(1, WORKERS) * 8
+TIMEOUT = float(os.environ.get('MJ_HASH_TIMEOUT', 10))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing another hash when MJ_HASH_MAX_PENDING calls are already waiting."""
+
+
+def _scrypt(password, salt, n, r, p):
+    # Runs in a pool process; maxmem is scrypt's own need plus some headroom
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def is_legacy(stored):
+    return len(stored) == 64 and not stored.startswith('scrypt$')
+
+
+class PasswordHasher:
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, workers=WORKERS, max_pending=MAX_PENDING,
+                 timeout=TIMEOUT):
+        self.n, self.r, self.p = n, r, p
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def _executor(self):
+        # Started on first use, i.e. inside the serving worker rather than a
+        # preloading master. By then request and background threads are
+        # running, so the pool processes come from a forkserver (a clean,
+        # single-threaded process) or are spawned, never a fork() of this one.
+        with self._lock:
+            if self._pool is None:
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload(['passwords'])
+                else:
+                    context = multiprocessing.get_context('spawn')
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def _submit(self, *args):
+        try:
+            return self._executor().submit(_scrypt, *args)
+        except BrokenProcessPool:
+            # A pool process died (e.g. OOM-killed); start a fresh pool once
+            with self._lock:
+                self._pool = None
+            return self._executor().submit(_scrypt, *args)
+
+    def _finished(self, future):
+        # The slot is held until the job is really over (done or cancelled
+        # while still queued), not just until the caller stops waiting
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _derive(self, password, salt, n, r, p):
+        if not self.workers:
+            return _scrypt(password, salt, n, r, p)
+        if not self._slots.acquire(blocking=False):
+            rejected.inc()
+            raise HasherBusy('Too many password hashes queued')
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._submit(password, salt, n, r, p)
+        except BaseException:
+            self._finished(None)
+            raise
+        future.add_done_callback(self._finished)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            rejected.inc()
+            raise HasherBusy('Password hash timed out in the queue')
+
+    def hash(self, password):
+        salt = os.urandom(SALT_BYTES)
+        key = self._derive(password, salt, self.n, self.r, self.p)
+        return f'scrypt${self.n}${self.r}${self.p}${_b64(salt)}${_b64(key)}'
+
+    def verify(self, password, stored):
+        """Check a password; returns (ok, new_hash), where new_hash replaces an outdated stored hash."""
+        if not stored or not isinstance(password, str):
+            # e.g. a Google-only account: cost the same as a real check
+            self.dummy_verify(password)
+            return False, None
+        if is_legacy(stored):
+            ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+            outdated = ok
+        else:
+            try:
+                _, n, r, p, salt, key = stored.split('$')
+                n, r, p = int(n), int(r), int(p)
+                salt, key = _unb64(salt), _unb64(key)
+            except ValueError:
+                self.dummy_verify(password)
+                return False, None
+            ok = hmac.compare_digest(self._derive(password, salt, n, r, p), key)
+            outdated = ok and (n, r, p) != (self.n, self.r, self.p)
+        if not outdated:
+            return ok, None
+        try:
+            return ok, self.hash(password)
+        except HasherBusy:
+            # The login itself succeeded; rehash on a quieter one
+            return ok, None
+
+    def dummy_verify(self, password):
+        """Spend the same time as a real check, so unknown emails cannot be told apart by timing."""
+        self._derive(password if isinstance(password, str) else '', b'\0' * SALT_BYTES, self.n, self.r, self.p)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _after_fork(self):
+        # The parent's pool processes belong to the parent
+        self._pool = None
+        self._lock = threading.Lock()
+
+
+hasher = PasswordHasher()
+if hasattr(os, 'register_at_fork'):  # Not on Windows, where nothing forks
+    os.register_at_fork(after_in_child=lambda: hasher._after_fork())
+
+rejected = metrics.Counter('mj_password_hash_rejected_total', 'Password hashes refused because the queue was full.')
+metrics.Gauge('mj_password_hash_pending', 'Password hashes queued or running in the pool.',
+              collect=lambda: {(): hasher.pending})
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+
+import db
+import http_client
+
+# --- Cached personality profiles ---
+# The analyzer looks at a user's latest ENTRY_WINDOW entries. The result is
+# kept in personality_cache and only recomputed after the user's entries change:
+# writes mark the row stale, and the next read (or the optional background
+# worker) refreshes it. A stale profile is still served if the analyzer is down.
+
+ENTRY_WINDOW = 20
+PRECOMPUTE = os.environ.get('MJ_PERSONALITY_PRECOMPUTE', '0') == '1'
+
+_pending = set()
+_pending_cond = threading.Condition()
+_worker = None
+
+
+def analyze_entries(entries):
+    """Send entry texts to the analyzer; returns its JSON or {'error': ...}."""
+    try:
+        response = http_client.analyzer.post("/analyze_entries", json={"entries": entries}, timeout=15)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return {'error': 'Analyzer error'}
+    except Exception as e:
+        return {'error': str(e)}
+
+
+async def analyze_entries_async(entries):
+    """analyze_entries() for the ASGI mode, over the pooled async client."""
+    try:
+        response = await http_client.async_analyzer.post("/analyze_entries", json={"entries": entries}, timeout=15)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return {'error': 'Analyzer error'}
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def load(conn, user_id):
+    """Return (profile, stale) from the cache, or None if nothing is cached."""
+    row = conn.execute('SELECT profile, stale FROM personality_cache WHERE user_id = ?', (user_id,)).fetchone()
+    if row is None:
+        return None
+    return json.loads(row['profile']) if row['profile'] else None, bool(row['stale'])
+
+
+def invalidate(conn, user_id):
+    # Keep the old profile around (as stale) for when the analyzer is unavailable
+    conn.execute('UPDATE personality_cache SET stale = 1 WHERE user_id = ?', (user_id,))
+
+
+def store(conn, user_id, rev, latest_entry_id, profile):
+    # Only store if the user's entries did not change (insert, edit, delete or
+    # import; see users.entries_rev) while the analyzer was working
+    conn.execute('''INSERT INTO personality_cache (user_id, latest_entry_id, profile, stale, computed_ms)
+        SELECT ?, ?, ?, 0, ?
+        WHERE (SELECT entries_rev FROM users WHERE id = ?) = ?
+        ON CONFLICT (user_id) DO UPDATE SET
+            latest_entry_id = excluded.latest_entry_id,
+            profile = excluded.profile,
+            stale = 0,
+            computed_ms = excluded.computed_ms''',
+        (user_id, latest_entry_id, json.dumps(profile), int(time.time() * 1000), user_id, rev))
+    conn.commit()
+
+
+def latest_entries(conn, user_id):
+    """Return (entries_rev, rows): the user's revision counter and the (id, text) rows the analyzer looks at."""
+    # The revision is read first, so a write in between can only make store() refuse
+    row = conn.execute('SELECT entries_rev FROM users WHERE id = ?', (user_id,)).fetchone()
+    rows = conn.execute('SELECT id, text FROM entries WHERE user_id = ? ORDER BY id DESC LIMIT ?',
+                        (user_id, ENTRY_WINDOW)).fetchall()
+    return (row[0] if row else None), rows
+
+
+def clear(conn, user_id):
+    conn.execute('DELETE FROM personality_cache WHERE user_id = ?', (user_id,))
+    conn.commit()
+
+
+# --- Serving /api/personality (shared by server.py and asgi.py) ---
+def lookup(conn, user_id):
+    """Returns (payload, None) when the cache answers, else (None, pending) to pass to the analyzer.
+
+    Normally a single primary-key lookup; the analyzer is only needed when the
+    user's entries changed since the cached profile was computed.
+    """
+    cached = load(conn, user_id)
+    if cached and not cached[1]:
+        return {'success': True, 'personality': cached[0]}, None
+    rev, rows = latest_entries(conn, user_id)
+    if not rows:
+        clear(conn, user_id)
+        return {'success': True, 'personality': None}, None
+    return None, (cached, rev, rows)
+
+
+def pending_texts(pending):
+    return [r['text'] for r in pending[2]]
+
+
+def complete(conn, user_id, pending, result):
+    """Store the analyzer's result for a lookup() and return the response payload."""
+    cached, rev, rows = pending
+    if 'error' in result:
+        # Analyzer down or its circuit is open: fall back to the last profile we computed
+        return {'success': True, 'personality': cached[0] if cached else None, 'stale': True}
+    profile = result.get('personality_profile')
+    store(conn, user_id, rev, rows[0]['id'], profile)
+    return {'success': True, 'personality': profile}
+
+
+def refresh(conn, user_id):
+    """Recompute a user's profile from their latest entries. Returns (profile, ok)."""
+    rev, rows = latest_entries(conn, user_id)
+    if not rows:
+        clear(conn, user_id)
+        return None, True
+    result = analyze_entries([r['text'] for r in rows])
+    if 'error' in result:
+        return None, False
+    profile = result.get('personality_profile')
+    store(conn, user_id, rev, rows[0]['id'], profile)
+    return profile, True
+
+
+# --- Optional background recomputation ---
+def schedule(user_id):
+    """Queue a refresh after a user's entries changed (no-op unless MJ_PERSONALITY_PRECOMPUTE=1)."""
+    if not PRECOMPUTE:
+        return
+    with _pending_cond:
+        _pending.add(user_id)
+        _pending_cond.notify()
+
+
+def _refresh_forever():
+    conn = db.pool.acquire()
+    while True:
+        with _pending_cond:
+            while not _pending:
+                _pending_cond.wait()
+            user_id = _pending.pop()
+        try:
+            refresh(conn, user_id)
+        except Exception as e:
+            print(f"Personality refresh failed for user {user_id}: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+
+
+def start_worker():
+    global _worker
+    if PRECOMPUTE and (_worker is None or not _worker.is_alive()):
+        _worker = threading.Thread(target=_refresh_forever, name='personality-refresh', daemon=True)
+        _worker.start()
+    return _worker
@@ -0,0 +1,198 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+import db
+import metrics
+
+# --- Rate limiting ---
+# Token buckets per client IP, per user and per submitted email address. A
+# bucket holds up to `count` requests and refills at count/seconds per
+# second, so short bursts pass and sustained floods are cut to the average
+# rate. A request must get a token from every bucket its rule names;
+# otherwise it is answered with 429 and a Retry-After header.
+#
+# The default in-memory store is per process: with N workers a client can
+# get up to N times the limit. MJ_RATELIMIT_STORE=sqlite keeps the buckets in
+# the database instead, shared by every worker, at the cost of one write per
+# limited request.
+
+ENABLED = os.environ.get('MJ_RATELIMIT', '1') == '1'
+STORE = os.environ.get('MJ_RATELIMIT_STORE', 'memory')
+MAX_KEYS = int(os.environ.get('MJ_RATELIMIT_MAX_KEYS', 100000))
+# How many reverse proxies in front of the app append to X-Forwarded-For (0:
+# ignore the header). Each proxy appends the address it saw, so the client is
+# the entry that many hops from the right; anything further left is whatever
+# the client sent and could be changed on every request.
+TRUST_FORWARDED = int(os.environ.get('MJ_RATELIMIT_TRUST_FORWARDED', 0))
+
+# "count/seconds" per rule and key. Override one with
+# MJ_RATELIMIT_<RULE>_<KEY>, e.g. MJ_RATELIMIT_LOGIN_IP=50/60, or set it to
+# "off" to drop that bucket.
+DEFAULT_RULES = {
+    'login': {'ip': '20/60', 'email': '5/60'},
+    'register': {'ip': '5/300'},
+    'request_reset': {'ip': '5/300', 'email': '3/300'},
+    'resend_verification': {'ip': '5/300', 'email': '3/300'},
+    # Unauthenticated and costs a full password hash per call
+    'reset_password': {'ip': '10/300', 'email': '5/300'},
+    'chat': {'user': '20/60', 'ip': '60/60'},
+}
+
+
+class Limit:
+    def __init__(self, count, seconds):
+        self.capacity = count
+        self.seconds = seconds
+        self.rate = count / seconds
+
+    @classmethod
+    def parse(cls, spec):
+        count, _, seconds = spec.partition('/')
+        return cls(int(count), float(seconds or 60))
+
+
+def load_rules(env=os.environ):
+    rules = {}
+    for name, keys in DEFAULT_RULES.items():
+        rules[name] = {}
+        for kind, spec in keys.items():
+            spec = env.get(f'MJ_RATELIMIT_{name.upper()}_{kind.upper()}', spec)
+            if spec != 'off':
+                rules[name][kind] = Limit.parse(spec)
+    return rules
+
+
+RULES = load_rules()
+
+rejected = metrics.Counter('mj_ratelimit_rejected_total', 'Requests refused by the rate limiter, by rule and key.',
+                           ('rule', 'key'))
+
+
+class MemoryStore:
+    """Buckets in an LRU dict: O(1) per hit. Past `max_keys` the least recently seen key is dropped,
+    which only forgets a bucket that has long since refilled."""
+
+    def __init__(self, max_keys=MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit):
+        """Take one token; return 0 if granted, else the seconds until one is available."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(limit.capacity), now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / limit.rate
+
+
+class SQLiteStore:
+    """Buckets in the rate_limits table, shared by every worker process.
+
+    A hit is one UPSERT that refills and takes a token only if one is there,
+    so concurrent workers cannot both spend the last token.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, clock=time.time):
+        # Wall-clock time: the rows outlive this process
+        self.clock = clock
+        self._hits = 0
+        # A bucket idle for its whole period is full again; dropping it changes nothing
+        self.idle_after = max(limit.seconds for keys in RULES.values() for limit in keys.values())
+
+    def hit(self, key, limit):
+        now = self.clock()
+        conn = db.pool.acquire()
+        try:
+            before = conn.total_changes
+            conn.execute('''INSERT INTO rate_limits (key, tokens, updated) VALUES (?1, ?2 - 1, ?3)
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = MIN(?2, tokens + (?3 - updated) * ?4) - 1,
+                    updated = ?3
+                WHERE MIN(?2, tokens + (?3 - updated) * ?4) >= 1''', (key, limit.capacity, now, limit.rate))
+            retry_after = 0.0
+            if conn.total_changes == before:
+                tokens, updated = conn.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?',
+                                               (key,)).fetchone()
+                tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+                retry_after = max(0.0, (1 - tokens) / limit.rate)
+            self._hits += 1
+            if self._hits % self.PURGE_EVERY == 0:
+                conn.execute('DELETE FROM rate_limits WHERE updated < ?', (now - self.idle_after,))
+            conn.commit()
+            return retry_after
+        finally:
+            db.pool.release(conn)
+
+
+store = SQLiteStore() if STORE == 'sqlite' else MemoryStore()
+
+
+def check(rule, ip=None, user=None, email=None):
+    """Spend a token from each of the rule's buckets; return 0 if allowed, else seconds to wait."""
+    values = {'ip': ip, 'user': user, 'email': email.strip().lower() if email else None}
+    retry_after = 0.0
+    for kind, limit in RULES[rule].items():
+        value = values.get(kind)
+        if value is None:
+            continue
+        wait = store.hit(f'{rule}:{kind}:{value}', limit)
+        if wait:
+            rejected.inc(rule, kind)
+            retry_after = max(retry_after, wait)
+    return retry_after
+
+
+def client_ip(remote_addr, forwarded_for=None):
+    if TRUST_FORWARDED and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',')]
+        # Fewer entries than proxies: all of them came from our proxies
+        return hops[-TRUST_FORWARDED] if len(hops) >= TRUST_FORWARDED else hops[0]
+    return remote_addr
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+# --- Flask ---
+def limit(rule):
+    """Throttle a view with RULES[rule]. Use below @auth_required for rules with a 'user' bucket."""
+    def decorator(f):
+        @wraps(f)
+        def inner(*args, **kwargs):
+            if ENABLED:
+                user = getattr(request, 'user', None)
+                data = request.get_json(silent=True) if 'email' in RULES[rule] else None
+                retry_after = check(
+                    rule,
+                    ip=client_ip(request.remote_addr, request.headers.get('X-Forwarded-For')),
+                    user=user['id'] if user else None,
+                    email=data.get('email') if isinstance(data, dict) and isinstance(data.get('email'), str) else None,
+                )
+                if retry_after:
+                    resp = jsonify({'success': False, 'message': 'Too many requests. Please try again shortly.'})
+                    resp.headers['Retry-After'] = retry_after_header(retry_after)
+                    return resp, 429
+            return f(*args, **kwargs)
+        return inner
+    return decorator
@@ -0,0 +1,161 @@
+import os
+import re
+from bisect import bisect_left
+from itertools import compress
+from operator import methodcaller
+
+# --- Lexicon-based sentiment scoring ---
+# Text is tokenized once; each token is then looked up in a hash map, so the
+# cost is linear in the text and independent of lexicon size. Multi-word
+# phrases are matched through a token trie (longest match wins). A lexicon hit
+# is flipped by a negator a few tokens before it ("not happy") and scaled by an
+# intensifier right before it ("very happy"). Clause punctuation ends a
+# negation window. With a small lexicon, a text that contains none of its
+# words anywhere (a plain substring check, as the old scorer did) is scored
+# 0 without being tokenized.
+
+# The original word lists, plus the inflections the old substring scan used to
+# catch by accident ('loved' contains 'love'), and a few common phrases.
+DEFAULT_LEXICON = {
+    'happy': 1, 'relieved': 1, 'good': 1, 'better': 1, 'calm': 1, 'hopeful': 1,
+    'grateful': 1, 'love': 1, 'loved': 1, 'loves': 1, 'loving': 1, 'excited': 1,
+    'sad': -1, 'depressed': -1, 'anxious': -1, 'angry': -1, 'hopeless': -1,
+    'worthless': -1, 'tired': -1, 'lonely': -1, 'hate': -1, 'hated': -1, 'hates': -1,
+    'at peace': 1, 'over the moon': 2,
+    'fed up': -1, 'burned out': -1, 'burnt out': -1, 'stressed out': -1,
+}
+
+NEGATORS = frozenset([
+    'not', 'no', 'never', 'nothing', 'nobody', 'none', 'neither', 'nor',
+    'cannot', 'without', 'hardly', 'barely',
+])
+NEGATION_WINDOW = 3
+# Up to this many lexicon words, a substring check for any of them is
+# cheaper than tokenizing a text that has none
+SCAN_MAX_TERMS = 64
+
+INTENSIFIERS = {
+    'very': 1.5, 'really': 1.5, 'so': 1.3, 'too': 1.3, 'extremely': 2.0,
+    'incredibly': 2.0, 'super': 1.5, 'totally': 1.5, 'completely': 1.5,
+    'quite': 1.2, 'slightly': 0.5, 'somewhat': 0.6, 'kinda': 0.7, 'little': 0.7,
+}
+
+_TOKEN_RE = re.compile(r"[\w']+|[.!?;,]")
+_CLAUSE_BREAKS = frozenset('.!?;,')
+_NEGATION_CONTEXT = NEGATORS | _CLAUSE_BREAKS
+_is_contraction = methodcaller('endswith', "n't")
+# ASCII characters that separate tokens without being one; ASCII text (the
+# usual case) is tokenized with translate/replace/split, which gives the
+# same tokens as _TOKEN_RE at a fraction of the cost
+_ASCII_SEPARATORS = str.maketrans({c: ' ' for c in map(chr, range(128))
+                                   if not (c.isalnum() or c in "_'" or c in _CLAUSE_BREAKS)})
+
+
+def tokenize(text):
+    text = (text or '').lower()
+    if not text.isascii():
+        return _TOKEN_RE.findall(text.replace('’', "'"))
+    text = text.translate(_ASCII_SEPARATORS)
+    for mark in _CLAUSE_BREAKS:
+        if mark in text:
+            text = text.replace(mark, f' {mark} ')
+    return text.split()
+
+
+def load_lexicon(path):
+    """Read a lexicon file: one `term<TAB>weight` per line; terms may contain spaces; # starts a comment."""
+    lexicon = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            term, _, weight = line.rpartition('\t')
+            if not term:
+                term, weight = line.rsplit(None, 1)
+            lexicon[term.strip().lower()] = float(weight)
+    return lexicon
+
+
+class Lexicon:
+    """A compiled lexicon: single words in a hash map, phrases in a token trie keyed by first word."""
+
+    def __init__(self, terms):
+        self.words = {}
+        self.phrases = {}  # first token -> trie of following tokens; None key holds the weight
+        for term, weight in terms.items():
+            tokens = tokenize(term)
+            if not tokens:
+                continue
+            if len(tokens) == 1:
+                self.words[tokens[0]] = float(weight)
+                continue
+            node = self.phrases.setdefault(tokens[0], {})
+            for tok in tokens[1:]:
+                node = node.setdefault(tok, {})
+            node[None] = float(weight)
+        self.triggers = frozenset(self.words) | frozenset(self.phrases)
+        self.scan_first = len(self.triggers) <= SCAN_MAX_TERMS
+
+    def match(self, tokens, i):
+        """Return (weight, length) of the longest term starting at tokens[i], or (None, 0)."""
+        best, length = self.words.get(tokens[i]), 1
+        node = self.phrases.get(tokens[i])
+        j = i + 1
+        while node and j < len(tokens):
+            node = node.get(tokens[j])
+            j += 1
+            if node and None in node:
+                best, length = node[None], j - i
+        return best, (length if best is not None else 0)
+
+    def score(self, text):
+        text = (text or '').lower().replace('’', "'")
+        if self.scan_first and not any(term in text for term in self.triggers):
+            return 0.0
+        tokens = tokenize(text)
+        positions = range(len(tokens))
+        words, phrases = self.words, self.phrases
+        # Positions of lexicon words, and of the tokens that decide negation
+        # (negators, "n't" words, clause breaks), found without a Python-level
+        # pass over every token. For each hit the nearest such token in the
+        # window before it decides whether the hit is negated.
+        hits = compress(positions, map(self.triggers.__contains__, tokens))
+        context = list(compress(positions, map(_NEGATION_CONTEXT.__contains__, tokens)))
+        if "n't" in text:
+            context = sorted(set(context).union(compress(positions, map(_is_contraction, tokens))))
+        total = 0.0
+        skip_until = 0
+        for i in hits:
+            if i < skip_until:
+                continue
+            if tokens[i] in phrases:
+                weight, length = self.match(tokens, i)
+                if weight is None:
+                    continue
+            else:
+                weight, length = words[tokens[i]], 1
+            skip_until = i + length
+            if i and tokens[i - 1] in INTENSIFIERS:
+                weight *= INTENSIFIERS[tokens[i - 1]]
+            k = bisect_left(context, i) - 1
+            if k >= 0 and context[k] >= i - NEGATION_WINDOW and tokens[context[k]] not in _CLAUSE_BREAKS:
+                weight = -weight
+            total += weight
+        return total
+
+
+def _default_lexicon():
+    terms = dict(DEFAULT_LEXICON)
+    path = os.environ.get('MJ_SENTIMENT_LEXICON')
+    if path:
+        terms.update(load_lexicon(path))
+    return Lexicon(terms)
+
+
+lexicon = _default_lexicon()
+
+
+def score(text):
+    """Sentiment score of a text: the sum of lexicon weights, positive is happier."""
+    return round(lexicon.score(text), 3)
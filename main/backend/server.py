@@ -1,26 +1,87 @@
 import os
+import re
+import io
+import csv
+import json
+import zlib
+import base64
+import html
 import sqlite3
 import datetime
+import time
 import jwt
 import hashlib
 import requests
-from flask import Flask, request, jsonify, send_from_directory
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, make_response, send_from_directory, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from authlib.integrations.flask_client import OAuth
 from flask import session
 
 # --- Load environment variables ---
+# Before the local modules below, which read their settings at import time
 load_dotenv()
 
+from db import get_db, init_app as init_db_app, to_epoch_ms, utc_now, tuple_cursor, SUPPORTS_RETURNING
+from migrations import migrate
+from cache import TTLCache
+import aggregates
+import assets
+import compression
+import http_client
+import jsonio
+import metrics
+import outbox
+import passwords
+import personality
+import ratelimit
+import sentiment
+import streaming
+
 # --- Flask App Setup ---
 app = Flask(__name__, static_folder='../public', static_url_path='/')
 CORS(app, resources={r"/*": {"origins": "*"}})  # Allow all origins for development
 SECRET = os.environ.get('MJ_SECRET', 'change_this_secret_123')
-DB = os.path.join(os.path.dirname(__file__), 'mood_journal.db')
+init_db_app(app)  # Pooled connections are returned when each app context tears down
+jsonio.init_app(app)  # orjson-backed jsonify() when orjson is installed
+compression.init_app(app)  # gzip/brotli for dynamic responses over MJ_COMPRESS_MIN_BYTES
+metrics.init_app(app)  # Request/DB/downstream timings, exposed on /metrics
+
+# --- Verified-user cache used by auth_required ---
+verified_users = TTLCache(
+    maxsize=int(os.environ.get('MJ_AUTH_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('MJ_AUTH_CACHE_TTL', 60))
+)
+
+# --- Pagination for /api/entries ---
+DEFAULT_PAGE_SIZE = int(os.environ.get('MJ_DEFAULT_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.environ.get('MJ_MAX_PAGE_SIZE', 200))
+
+# --- Search paging ---
+# How long a search's cursors stay valid, and how many hits can be paged
+# through (see search_entries)
+SEARCH_SNAPSHOT_TTL_MS = int(float(os.environ.get('MJ_SEARCH_SNAPSHOT_TTL', 600)) * 1000)
+SEARCH_MAX_RESULTS = int(os.environ.get('MJ_SEARCH_MAX_RESULTS', 500))
+
+# --- Streaming export ---
+EXPORT_BATCH_ROWS = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# --- Bulk import ---
+BULK_BATCH_ROWS = 500
+BULK_MAX_ROWS = int(os.environ.get('MJ_BULK_MAX_ROWS', 100000))
+BULK_MAX_ERRORS = 100  # Per-row errors reported back; the rest are only counted
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+
+# --- Batch analysis ---
+ANALYZE_BATCH_MAX = int(os.environ.get('MJ_ANALYZE_BATCH_MAX', 100))
+# Shared by all requests, so this also caps concurrent /predict calls process-wide
+analyze_fanout = ThreadPoolExecutor(max_workers=int(os.environ.get('MJ_ANALYZE_FANOUT', 4)),
+                                    thread_name_prefix='analyze-fanout')
 
 # --- URL for your separate email service ---
-EMAIL_SERVICE_URL = "http://127.0.0.1:3000"
+EMAIL_SERVICE_URL = http_client.email.base_url
 
 # --- OAuth Setup ---
 app.secret_key = SECRET # Required for sessions
@@ -49,55 +110,27 @@ facebook = oauth.register(
 )
 
 # --- Database Helper Functions ---
-def get_db():
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def init_db():
-    conn = get_db()
-    c = conn.cursor()
-    # The 'is_verified' column is crucial for the email verification flow
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE,
-        password TEXT,
-        is_verified BOOLEAN DEFAULT 0,
-        createdAt TEXT
-    )''')
-    
-    # --- Migration: Add new profile columns if they don't exist ---
-    existing_cols = [row['name'] for row in c.execute("PRAGMA table_info(users)")]
-    new_cols = {
-        'avatar': 'TEXT',
-        'full_name': 'TEXT',
-        'bio': 'TEXT',
-        'location': 'TEXT',
-        'interests': 'TEXT',  # Stored as JSON string
-        'date_of_birth': 'TEXT',
-        'oauth_provider': 'TEXT',
-        'oauth_id': 'TEXT'
-    }
-    
-    for col, data_type in new_cols.items():
-        if col not in existing_cols:
-            print(f"Migrating DB: Adding '{col}' column to users table...")
-            try:
-                c.execute(f"ALTER TABLE users ADD COLUMN {col} {data_type}")
-            except Exception as e:
-                print(f"Error adding {col}: {e}")
-
-    c.execute('''CREATE TABLE IF NOT EXISTS entries (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        text TEXT,
-        mood TEXT,
-        sentiment REAL,
-        createdAt TEXT
-    )''')
-    conn.commit()
-    conn.close()
-
+    with app.app_context():
+        version = migrate(get_db())
+    print(f"🗄️  Database schema at version {version}")
+
+
+# --- Authentication Helpers ---
+def issue_token(user_id, email):
+    # Only verified users are ever issued a token, and verification is never
+    # revoked, so the claim lets auth_required skip the users lookup.
+    return jwt.encode({'id': user_id, 'email': email, 'verified': True}, SECRET, algorithm='HS256')
+
+def is_user_verified(user_id, conn=None):
+    verified = verified_users.get(user_id)
+    if verified is None:
+        row = (conn or get_db()).execute('SELECT is_verified FROM users WHERE id=?', (user_id,)).fetchone()
+        if not row:
+            return False
+        verified = bool(row['is_verified'])
+        verified_users.set(user_id, verified)
+    return verified
 
 # --- Authentication Decorator to check for verification ---
 def auth_required(f):
@@ -110,14 +143,11 @@ def auth_required(f):
         token = auth.split(' ', 1)[1]
         try:
             data = jwt.decode(token, SECRET, algorithms=['HS256'])
-            
-            # Check if the user is verified in the main app's database
-            conn = get_db()
-            c = conn.cursor()
-            user = c.execute('SELECT is_verified FROM users WHERE id=?', (data['id'],)).fetchone()
-            conn.close()
+            user_id = data['id']
 
-            if not user or user['is_verified'] == 0:
+            # Tokens issued before the 'verified' claim existed still need
+            # a (cached) lookup in the main app's database
+            if not data.get('verified') and not is_user_verified(user_id):
                 return jsonify({'success': False, 'message': 'Email not verified. Please verify your email to continue.'}), 403
 
             request.user = data
@@ -127,22 +157,59 @@ def auth_required(f):
             return jsonify({'success': False, 'message': 'Invalid or expired token.'}), 401
     return inner
 
+# --- Conditional GET (ETag / If-None-Match) ---
+def conditional(rev_column, daily=False):
+    """Tag GET responses with a weak ETag from the user's revision counter (users.<rev_column>).
+
+    A request whose If-None-Match still matches gets a bare 304 before the
+    handler runs. Use below @auth_required. `daily` folds in the UTC date for
+    responses whose default range is relative to today.
+    """
+    from functools import wraps
+    def decorator(f):
+        @wraps(f)
+        def inner(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+            row = get_db().execute(f'SELECT {rev_column} FROM users WHERE id=?', (request.user['id'],)).fetchone()
+            if row is None:
+                return f(*args, **kwargs)
+            key = f"{request.user['id']}:{row[0]}:{request.full_path}"
+            if daily:
+                key += ':' + datetime.datetime.utcnow().date().isoformat()
+            etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Let clients keep a copy but always revalidate it
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Authorization')
+            return response
+        return inner
+    return decorator
+
+USER_PROFILE_COLUMNS = 'id, email, is_verified, avatar, full_name, bio, location, interests, date_of_birth, createdAt'
+
 @app.route('/api/auth/me', methods=['GET', 'PUT'])
 @auth_required
+@conditional('profile_rev')
 def handle_me():
     conn = get_db()
     c = conn.cursor()
 
     if request.method == 'GET':
-        user = c.execute('SELECT id, email, is_verified, avatar, full_name, bio, location, interests, date_of_birth, createdAt FROM users WHERE id=?',
+        user = c.execute(f'SELECT {USER_PROFILE_COLUMNS} FROM users WHERE id=?',
                          (request.user['id'],)).fetchone()
-        conn.close()
         if not user:
             return jsonify({"error": "User not found"}), 404
             
         user_dict = dict(user)
         # Parse interests from JSON string if it exists
-        import json
         if user_dict.get('interests'):
             try:
                 user_dict['interests'] = json.loads(user_dict['interests'])
@@ -174,12 +241,10 @@ def handle_me():
 
         # Handle interests specifically (convert list to JSON string)
         if 'interests' in data:
-            import json
             updates.append("interests = ?")
             params.append(json.dumps(data['interests']))
 
         if not updates:
-            conn.close()
             return jsonify({"success": False, "message": "No valid fields to update"}), 400
 
         # Add updated_at if you want track that, but for now just the fields
@@ -188,13 +253,19 @@ def handle_me():
         params.append(request.user['id'])
         
         try:
-            c.execute(query, tuple(params))
-            conn.commit()
-            
-            # Fetch updated user to return
-            updated_user = c.execute('SELECT id, email, is_verified, avatar, full_name, bio, location, interests, date_of_birth, createdAt FROM users WHERE id=?',
-                             (request.user['id'],)).fetchone()
-            conn.close()
+            if SUPPORTS_RETURNING:
+                # Get the updated profile back from the UPDATE itself
+                rows = c.execute(f'{query} RETURNING {USER_PROFILE_COLUMNS}', tuple(params)).fetchall()
+                conn.commit()
+                updated_user = rows[0] if rows else None
+            else:
+                c.execute(query, tuple(params))
+                conn.commit()
+                updated_user = c.execute(f'SELECT {USER_PROFILE_COLUMNS} FROM users WHERE id=?',
+                                         (request.user['id'],)).fetchone()
+            verified_users.invalidate(request.user['id'])
+            if not updated_user:
+                return jsonify({"error": "User not found"}), 404
             
             user_dict = dict(updated_user)
             if user_dict.get('interests'):
@@ -206,25 +277,24 @@ def handle_me():
             return jsonify({"success": True, "message": "Profile updated", "user": user_dict})
             
         except Exception as e:
-            conn.close()
             print(f"Error updating profile: {e}")
             return jsonify({"success": False, "message": "Database error during update"}), 500
 
 
 
 def hash_pwd(p):
-    # In a production app, consider using a stronger hashing algorithm like bcrypt
-    return hashlib.sha256(p.encode()).hexdigest()
+    # scrypt in the passwords process pool; raises passwords.HasherBusy when its queue is full
+    return passwords.hasher.hash(p)
 
-# --- Simple Sentiment + Personality Estimators ---
-POS_WORDS = set(['happy', 'relieved', 'good', 'better', 'calm', 'hopeful', 'grateful', 'love', 'excited'])
-NEG_WORDS = set(['sad', 'depressed', 'anxious', 'angry', 'hopeless', 'worthless', 'tired', 'lonely', 'hate'])
+def hashing_busy():
+    resp = jsonify({'success': False, 'message': 'The server is busy. Please try again in a moment.'})
+    resp.headers['Retry-After'] = '1'
+    return resp, 503
 
+# --- Simple Sentiment + Personality Estimators ---
 def simple_sentiment(text):
-    t = (text or '').lower()
-    p = sum(1 for w in POS_WORDS if w in t)
-    n = sum(1 for w in NEG_WORDS if w in t)
-    return p - n
+    # Token/lexicon based scorer; see sentiment.py
+    return sentiment.score(text)
 
 def gemini_sentiment(text):
     """Fallback to simple sentiment estimator."""
@@ -233,11 +303,7 @@ def gemini_sentiment(text):
 # Function to call the new personality analyzer
 def estimate_personality(text):
     try:
-        response = requests.post(
-            "http://127.0.0.1:5003/predict",
-            json={"text": text},
-            timeout=10
-        )
+        response = http_client.analyzer.post("/predict", json={"text": text}, timeout=10)
         if response.status_code == 200:
             return response.json()
         else:
@@ -245,90 +311,86 @@ def estimate_personality(text):
     except Exception as e:
         return {'error': str(e)}
 
-# Function to analyze multiple entries with the new analyzer
-def analyze_entries(entries):
+# Function to analyze many texts at once, one profile per text
+def estimate_personalities(texts):
     try:
-        response = requests.post(
-            "http://127.0.0.1:5003/analyze_entries",
-            json={"entries": entries},
-            timeout=15
-        )
+        response = http_client.analyzer.post("/predict_batch", json={"texts": texts}, timeout=30)
         if response.status_code == 200:
-            return response.json()
-        else:
-            return {'error': 'Analyzer error'}
+            results = response.json().get('results')
+            if isinstance(results, list) and len(results) == len(texts):
+                return results
+            return [{'error': 'Analyzer returned a malformed batch'}] * len(texts)
+        if response.status_code != 404:
+            return [{'error': 'Analyzer error'}] * len(texts)
     except Exception as e:
-        return {'error': str(e)}
+        # Includes an open circuit: fail the whole batch fast
+        return [{'error': str(e)}] * len(texts)
+    # An older analyzer without /predict_batch: bounded concurrent fan-out over /predict
+    return list(analyze_fanout.map(estimate_personality, texts))
 
 # --- Routes ---
 @app.route('/')
 def index():
-    return app.send_static_file('index.html')
+    # Script and style references point at content-hashed, immutable URLs,
+    # so only this small page has to be revalidated on each load
+    response = make_response(assets.render_index())
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag(weak=True)  # Weak, so it holds across content codings
+    return response.make_conditional(request)
+
+@app.route('/assets/<asset_hash>/<path:filename>')
+def hashed_asset(asset_hash, filename):
+    return assets.send_asset(asset_hash, filename)
     
 @app.route('/api/personality')
 @auth_required
 def get_personality_api():
     conn = get_db()
-    c = conn.cursor()
-
-    rows = c.execute(
-        'SELECT text FROM entries WHERE user_id=? ORDER BY id DESC LIMIT 20',
-        (request.user['id'],)
-    ).fetchall()
-    conn.close()
-
-    if not rows:
-        return jsonify({'success': True, 'personality': None})
-
-    entries = [r['text'] for r in rows]
-    personality = analyze_entries(entries)
-    
-    return jsonify({'success': True, 'personality': personality.get('personality_profile')})
+    payload, pending = personality.lookup(conn, request.user['id'])
+    if pending:
+        result = personality.analyze_entries(personality.pending_texts(pending))
+        payload = personality.complete(conn, request.user['id'], pending, result)
+    return jsonify(payload)
 
 # --- Auth Routes ---
 @app.route('/api/auth/register', methods=['POST'])
+@ratelimit.limit('register')
 def register():
     data = request.get_json() or {}
     email = data.get('email')
     pwd = data.get('password')
     if not email or not pwd:
         return jsonify({'success': False, 'message': 'Email & password are required'}), 400
-    
+    try:
+        pwd_hash = hash_pwd(pwd)
+    except passwords.HasherBusy:
+        return hashing_busy()
+
     conn = get_db()
     c = conn.cursor()
     try:
         # Create user with is_verified set to 0 (false)
+        created_at, created_ms = utc_now()
         c.execute(
-            'INSERT INTO users (email, password, is_verified, createdAt) VALUES (?,?,?,?)',
-            (email, hash_pwd(pwd), 0, datetime.datetime.utcnow().isoformat())
+            'INSERT INTO users (email, password, is_verified, createdAt, created_ms) VALUES (?,?,?,?,?)',
+            (email, pwd_hash, 0, created_at, created_ms)
         )
+        # Queue the verification code in the same transaction; the outbox
+        # dispatcher delivers it through the email service and retries failures
+        outbox.enqueue(conn, outbox.VERIFICATION, email)
         conn.commit()
-        
-        # Call the separate Node.js email service to send the verification code
-        try:
-            response = requests.post(
-                f"{EMAIL_SERVICE_URL}/send-verification-code",
-                json={"email": email},
-                timeout=10
-            )
-            response.raise_for_status()
-
-            return jsonify({
-                'success': True,
-                'message': 'Account created. Please check your email to verify your account.'
-            })
-
-        except requests.exceptions.RequestException as e:
-            # If the email service fails, we have a user who can't verify.
-            print(f"Error calling email service: {e}")
-            return jsonify({'success': False, 'message': 'Failed to send verification email. Please try again.'}), 500
+        outbox.notify()
+
+        return jsonify({
+            'success': True,
+            'message': 'Account created. Please check your email to verify your account.'
+        })
 
     except sqlite3.IntegrityError:
         return jsonify({'success': False, 'message': 'An account with this email already exists.'}), 409
-    finally:
-        conn.close()
 
 @app.route('/api/auth/request-reset', methods=['POST'])
+@ratelimit.limit('request_reset')
 def request_reset():
     data = request.get_json() or {}
     email = data.get('email')
@@ -336,20 +398,18 @@ def request_reset():
     if not email:
         return jsonify({'success': False, 'message': 'Email is required'}), 400
 
-    # Call Node.js email service
-    try:
-        response = requests.post(
-            f"{EMAIL_SERVICE_URL}/send-password-reset",
-            json={"email": email},
-            timeout=10
-        )
-        response.raise_for_status()
-        return jsonify({'success': True, 'message': 'Reset code sent to email'})
-    except Exception as e:
-        print(f"Email service error: {e}")
-        return jsonify({'success': False, 'message': f'Failed to send reset email: {str(e)}'}), 500
+    conn = get_db()
+    outbox.enqueue(conn, outbox.PASSWORD_RESET, email)
+    conn.commit()
+    outbox.notify()
+    return jsonify({'success': True, 'message': 'Reset code sent to email'})
+
+def set_password(conn, email, password_hash):
+    conn.execute('UPDATE users SET password=? WHERE email=?', (password_hash, email))
+    conn.commit()
 
 @app.route('/api/auth/reset-password', methods=['POST'])
+@ratelimit.limit('reset_password')
 def reset_password():
     data = request.get_json() or {}
     email = data.get('email')
@@ -361,12 +421,17 @@ def reset_password():
     if not email or not code or not new_password:
         print("Missing required parameters")
         return jsonify({'success': False, 'message': 'Email, code, and new password required'}), 400
+    # Hash first: the reset code is spent once the email service accepts it
+    try:
+        password_hash = hash_pwd(new_password)
+    except passwords.HasherBusy:
+        return hashing_busy()
 
     # Validate code via email service
     try:
         print(f"Calling email service at {EMAIL_SERVICE_URL}/verify-password-reset")
-        response = requests.post(
-            f"{EMAIL_SERVICE_URL}/verify-password-reset",
+        response = http_client.email.post(
+            "/verify-password-reset",
             json={"email": email, "code": code},
             timeout=30
         )
@@ -385,12 +450,8 @@ def reset_password():
             return jsonify({'success': False, 'message': 'Invalid reset code'}), 400
 
         # Update password in database
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('UPDATE users SET password=? WHERE email=?', (hash_pwd(new_password), email))
-        conn.commit()
-        conn.close()
-        
+        set_password(get_db(), email, password_hash)
+
         print("Password updated successfully in database")
         return jsonify({'success': True, 'message': 'Password updated successfully'})
 
@@ -403,6 +464,7 @@ def reset_password():
         traceback.print_exc()
         return jsonify({'success': False, 'message': 'Reset service error'}), 500
 @app.route('/api/auth/login', methods=['POST'])
+@ratelimit.limit('login')
 def login():
     data = request.get_json() or {}
     email = data.get('email')
@@ -410,18 +472,45 @@ def login():
     conn = get_db()
     c = conn.cursor()
     user = c.execute('SELECT id,email,password,is_verified FROM users WHERE email=?', (email,)).fetchone()
-    conn.close()
-    
-    if not user or hash_pwd(pwd) != user['password']:
+
+    try:
+        if user:
+            ok, new_hash = passwords.hasher.verify(pwd, user['password'])
+        else:
+            passwords.hasher.dummy_verify(pwd)
+            ok, new_hash = False, None
+    except passwords.HasherBusy:
+        return hashing_busy()
+    if not ok:
         return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+    if new_hash:
+        # Legacy SHA-256 or older scrypt cost: upgrade while we have the plaintext
+        c.execute('UPDATE users SET password=? WHERE id=? AND password=?', (new_hash, user['id'], user['password']))
+        conn.commit()
         
     # Check if user is verified before allowing login
     if user['is_verified'] == 0:
         return jsonify({'success': False, 'message': 'Please verify your email before logging in.'}), 403
         
-    token = jwt.encode({'id': user['id'], 'email': user['email']}, SECRET, algorithm='HS256')
+    token = issue_token(user['id'], user['email'])
     return jsonify({'success': True, 'token': token})
 
+def mark_verified(conn, email):
+    """Flag the account as verified; returns its (id, email) row, or None if there is no such user."""
+    c = conn.cursor()
+    if SUPPORTS_RETURNING:
+        rows = c.execute('UPDATE users SET is_verified=1 WHERE email=? RETURNING id, email', (email,)).fetchall()
+        conn.commit()
+        user = rows[0] if rows else None
+    else:
+        c.execute('UPDATE users SET is_verified=1 WHERE email=?', (email,))
+        conn.commit()
+        # Fetch the user to create a token for them
+        user = c.execute('SELECT id, email FROM users WHERE email=?', (email,)).fetchone()
+    if user:
+        verified_users.invalidate(user['id'])
+    return user
+
 @app.route('/api/auth/verify-email', methods=['POST'])
 def verify_email():
     data = request.get_json() or {}
@@ -433,8 +522,8 @@ def verify_email():
 
     # 1. Call the Node.js email service to validate the code
     try:
-        response = requests.post(
-            f"{EMAIL_SERVICE_URL}/verify-code",
+        response = http_client.email.post(
+            "/verify-code",
             json={"email": email, "code": code},
             timeout=10
         )
@@ -444,18 +533,10 @@ def verify_email():
         # 2. If the Node.js service says the code is valid...
         if result.get('success'):
             # ...update the user's status in the Flask app's database
-            conn = get_db()
-            c = conn.cursor()
-            c.execute('UPDATE users SET is_verified=1 WHERE email=?', (email,))
-            conn.commit()
-            
-            # Fetch the user to create a token for them
-            user = c.execute('SELECT id, email FROM users WHERE email=?', (email,)).fetchone()
-            conn.close()
-
+            user = mark_verified(get_db(), email)
             if user:
                 # 3. Log the user in by generating a JWT
-                token = jwt.encode({'id': user['id'], 'email': user['email']}, SECRET, algorithm='HS256')
+                token = issue_token(user['id'], user['email'])
                 return jsonify({
                     'success': True,
                     'message': 'Email verified successfully!',
@@ -472,6 +553,7 @@ def verify_email():
         return jsonify({'success': False, 'message': 'Could not connect to verification service.'}), 500
 
 @app.route('/api/auth/resend-verification', methods=['POST'])
+@ratelimit.limit('resend_verification')
 def resend_verification():
     data = request.get_json() or {}
     email = data.get('email')
@@ -482,7 +564,6 @@ def resend_verification():
     conn = get_db()
     c = conn.cursor()
     user = c.execute('SELECT id, is_verified FROM users WHERE email=?', (email,)).fetchone()
-    conn.close()
     
     if not user:
         return jsonify({'success': False, 'message': 'No account found with this email.'}), 404
@@ -490,26 +571,48 @@ def resend_verification():
     if user['is_verified'] == 1:
         return jsonify({'success': False, 'message': 'This account is already verified.'}), 400
         
-    # Call the email service to resend the verification code
-    try:
-        response = requests.post(
-            f"{EMAIL_SERVICE_URL}/send-verification-code",
-            json={"email": email},
-            timeout=10
-        )
-        response.raise_for_status()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Verification email sent. Please check your inbox.'
-        })
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling email service: {e}")
-        return jsonify({'success': False, 'message': 'Failed to send verification email. Please try again.'}), 500
+    # Queue the code again; a resend that is still waiting to go out is coalesced
+    outbox.enqueue(conn, outbox.VERIFICATION, email)
+    conn.commit()
+    outbox.notify()
+
+    return jsonify({
+        'success': True,
+        'message': 'Verification email sent. Please check your inbox.'
+    })
 
 # --- Journal Entries (all protected by auth_required) ---
+ENTRY_FIELDS = ('id', 'user_id', 'text', 'mood', 'sentiment', 'createdAt')
+
+def encode_cursor(*key):
+    # Opaque to clients; it is simply the sort key of the last row, e.g. (created_ms, id)
+    raw = ':'.join(str(k) for k in key).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def cursor_parts(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+
+def decode_cursor(cursor, *types):
+    parts = cursor_parts(cursor)
+    if len(parts) != len(types):
+        raise ValueError('Malformed cursor')
+    return tuple(t(p) for t, p in zip(types, parts))
+
+def parse_entry_fields(value):
+    """Parse the `fields=` projection, e.g. fields=id,mood,createdAt for list views."""
+    if not value:
+        return ENTRY_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in ENTRY_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
 @app.route('/api/entries', methods=['POST', 'GET'])
 @auth_required
+@conditional('entries_rev')
 def entries():
     conn = get_db()
     c = conn.cursor()
@@ -517,58 +620,443 @@ def entries():
     if request.method == 'POST':
         data = request.get_json() or {}
         text = data.get('text', '')
-        mood = data.get('mood', 'neutral')
+        mood = data.get('mood') or 'neutral'
         
         # Use Gemini sentiment for better understanding (includes non-English)
         sentiment_score = gemini_sentiment(text)
         
-        c.execute(
-            'INSERT INTO entries (user_id,text,mood,sentiment,createdAt) VALUES (?,?,?,?,?)',
-            (request.user['id'], text, mood, sentiment_score, datetime.datetime.utcnow().isoformat())
-        )
-        conn.commit()
-        eid = c.lastrowid
-        row = c.execute(
-            'SELECT id,user_id,text,mood,sentiment,createdAt FROM entries WHERE id=?',
-            (eid,)
-        ).fetchone()
-        conn.close()
+        created_at, created_ms = utc_now()
+        insert = 'INSERT INTO entries (user_id,text,mood,sentiment,createdAt,created_ms) VALUES (?,?,?,?,?,?)'
+        values = (request.user['id'], text, mood, sentiment_score, created_at, created_ms)
+        if SUPPORTS_RETURNING:
+            row = c.execute(insert + ' RETURNING id,user_id,text,mood,sentiment,createdAt', values).fetchall()[0]
+            aggregates.add_entry(conn, request.user['id'], created_at, mood, sentiment_score)
+            personality.invalidate(conn, request.user['id'])
+            conn.commit()
+        else:
+            c.execute(insert, values)
+            aggregates.add_entry(conn, request.user['id'], created_at, mood, sentiment_score)
+            personality.invalidate(conn, request.user['id'])
+            conn.commit()
+            row = c.execute(
+                'SELECT id,user_id,text,mood,sentiment,createdAt FROM entries WHERE id=?',
+                (c.lastrowid,)
+            ).fetchone()
+        personality.schedule(request.user['id'])
         return jsonify({'success': True, 'entry': dict(row)})
 
-    # GET
-    limit = int(request.args.get('limit', 200))
-    rows = c.execute(
-        'SELECT id,user_id,text,mood,sentiment,createdAt FROM entries WHERE user_id=? ORDER BY datetime(createdAt) DESC LIMIT ?',
-        (request.user['id'], limit)
+    # GET: newest first, paged with keyset cursors on (created_ms, id).
+    # `before` walks towards older entries, `after` towards newer ones.
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    before = request.args.get('before')
+    after = request.args.get('after')
+    if before and after:
+        return jsonify({'success': False, 'message': 'Use either before or after, not both'}), 400
+    try:
+        fields = parse_entry_fields(request.args.get('fields'))
+        cursor = decode_cursor(before or after, int, int) if (before or after) else None
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid query: {e}'}), 400
+
+    # The requested fields come first so rows can be zipped with them directly
+    columns = tuple(dict.fromkeys(fields + ('id', 'created_ms')))
+    id_col, ms_col = columns.index('id'), columns.index('created_ms')
+    query = f"SELECT {', '.join(columns)} FROM entries WHERE user_id=?"
+    params = [request.user['id']]
+    if before:
+        query += ' AND (created_ms, id) < (?, ?)'
+        params.extend(cursor)
+    elif after:
+        query += ' AND (created_ms, id) > (?, ?)'
+        params.extend(cursor)
+    order = 'ASC' if after else 'DESC'
+    query += f' ORDER BY created_ms {order}, id {order} LIMIT ?'
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+
+    rows = tuple_cursor(conn).execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after:
+        rows.reverse()
+
+    if after:
+        next_cursor = encode_cursor(rows[-1][ms_col], rows[-1][id_col]) if rows else after
+        prev_cursor = encode_cursor(rows[0][ms_col], rows[0][id_col]) if rows and has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1][ms_col], rows[-1][id_col]) if rows and has_more else None
+        prev_cursor = encode_cursor(rows[0][ms_col], rows[0][id_col]) if rows and before else None
+
+    return jsonify({
+        'success': True,
+        'entries': jsonio.rows_to_objects(rows, fields),
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+    })
+
+def build_fts_query(user_id, q):
+    """Turn free text into a safe FTS5 query: every word quoted, a trailing * kept as a prefix match."""
+    terms = []
+    for word, star in re.findall(r'(\w+)(\*?)', q or ''):
+        terms.append(f'"{word}"{star}')
+    if not terms:
+        raise ValueError('Search query must contain at least one word')
+    return f'user_id:"{int(user_id)}" AND text:({" ".join(terms)})'
+
+SEARCH_FIELDS = ('id', 'mood', 'sentiment', 'createdAt', 'snippet')
+
+@app.route('/api/entries/search')
+@auth_required
+def search_entries():
+    # Ranked (bm25) search over the user's own entries, with a highlighted
+    # snippet per hit. bm25 scores depend on the whole index, so any new entry
+    # (anyone's) reorders the hits and a (rank, id) cursor would skip or repeat
+    # them. Instead:
+    # - the first page is a plain ranked LIMIT query; its cursor lists the ids
+    #   it showed;
+    # - the second page ranks the best SEARCH_MAX_RESULTS hits once more, drops
+    #   those already shown, and keeps the result as a snapshot, which later
+    #   cursors point into for MJ_SEARCH_SNAPSHOT_TTL seconds.
+    # So a hit is never shown twice; hits past SEARCH_MAX_RESULTS are not paged
+    # to. Clients send the same q/mood/from/to with every page.
+    limit = request.args.get('limit', 20, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    user_id = request.user['id']
+    conn = get_db()
+    try:
+        cursor = [int(part) for part in cursor_parts(request.args['cursor'])] if request.args.get('cursor') else []
+        if cursor and cursor[0]:
+            if len(cursor) != 2:
+                raise ValueError('Malformed cursor')
+            snapshot_id, offset = cursor
+            match, ids = load_search_snapshot(conn, snapshot_id, user_id)
+        else:
+            match = build_fts_query(user_id, request.args.get('q'))
+            mood = request.args.get('mood')
+            start = aggregates.day_bounds_ms(request.args['from'])[0] if request.args.get('from') else None
+            end = aggregates.day_bounds_ms(request.args['to'])[1] if request.args.get('to') else None
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid query: {e}'}), 400
+
+    try:
+        if not cursor:
+            # First page: nothing is stored unless a second page is asked for
+            ids = ranked_ids(conn, match, user_id, mood, start, end, limit + 1)
+            rows = search_page(conn, match, user_id, ids[:limit])
+            next_cursor = encode_cursor(0, *ids[:limit]) if len(ids) > limit else None
+        else:
+            if not cursor[0]:
+                shown = cursor[1:]
+                seen = set(shown)
+                ranked = ranked_ids(conn, match, user_id, mood, start, end, SEARCH_MAX_RESULTS + len(shown))
+                ids = shown + [i for i in ranked if i not in seen][:max(0, SEARCH_MAX_RESULTS - len(shown))]
+                offset = len(shown)
+                snapshot_id = save_search_snapshot(conn, user_id, match, ids)
+            rows = search_page(conn, match, user_id, ids[offset:offset + limit])
+            next_cursor = encode_cursor(snapshot_id, offset + limit) if len(ids) > offset + limit else None
+    except sqlite3.OperationalError as e:
+        return jsonify({'success': False, 'message': f'Invalid search: {e}'}), 400
+    return jsonify({
+        'success': True,
+        'results': jsonio.rows_to_objects(rows, SEARCH_FIELDS),
+        'next_cursor': next_cursor,
+    })
+
+def ranked_ids(conn, match, user_id, mood, start, end, limit):
+    query = '''SELECT e.id FROM entries_fts f JOIN entries e ON e.id = f.rowid
+        WHERE entries_fts MATCH ? AND e.user_id = ?'''
+    params = [match, user_id]
+    if mood:
+        query += ' AND e.mood = ?'
+        params.append(mood)
+    if start is not None:
+        query += ' AND e.created_ms >= ?'
+        params.append(start)
+    if end is not None:
+        query += ' AND e.created_ms < ?'
+        params.append(end)
+    query += ' ORDER BY f.rank, e.id LIMIT ?'
+    params.append(limit)
+    return [row[0] for row in conn.execute(query, params)]
+
+# Snippet highlight markers: private-use characters that cannot clash with
+# the entry text, swapped for <mark> once the text has been HTML-escaped
+MARK_OPEN, MARK_CLOSE = '\ue000', '\ue001'
+
+def highlight(snippet):
+    return html.escape(snippet or '').replace(MARK_OPEN, '<mark>').replace(MARK_CLOSE, '</mark>')
+
+def search_page(conn, match, user_id, page_ids):
+    """Fetch the hits for page_ids (with snippets), in page_ids order."""
+    if not page_ids:
+        return []
+    rows = tuple_cursor(conn).execute(
+        f'''SELECT e.id, e.mood, e.sentiment, e.createdAt,
+            snippet(entries_fts, 0, '{MARK_OPEN}', '{MARK_CLOSE}', '…', 16) AS snippet
+        FROM entries_fts f JOIN entries e ON e.id = f.rowid
+        WHERE entries_fts MATCH ? AND e.user_id = ? AND f.rowid IN ({', '.join('?' * len(page_ids))})''',
+        [match, user_id, *page_ids]
     ).fetchall()
-    conn.close()
-    return jsonify({'success': True, 'entries': [dict(r) for r in rows]})
+    by_id = {row[0]: row[:4] + (highlight(row[4]),) for row in rows}
+    return [by_id[i] for i in page_ids if i in by_id]
+
+def save_search_snapshot(conn, user_id, match, ids):
+    _, now_ms = utc_now()
+    # Expired snapshots are only ever dropped here, when a new one is taken
+    conn.execute('DELETE FROM search_snapshots WHERE created_ms < ?', (now_ms - SEARCH_SNAPSHOT_TTL_MS,))
+    cur = conn.execute('INSERT INTO search_snapshots (user_id, query, ids, created_ms) VALUES (?,?,?,?)',
+                       (user_id, match, json.dumps(ids, separators=(',', ':')), now_ms))
+    conn.commit()
+    return cur.lastrowid
+
+def load_search_snapshot(conn, snapshot_id, user_id):
+    _, now_ms = utc_now()
+    row = conn.execute('SELECT query, ids FROM search_snapshots WHERE id = ? AND user_id = ? AND created_ms >= ?',
+                       (snapshot_id, user_id, now_ms - SEARCH_SNAPSHOT_TTL_MS)).fetchone()
+    if row is None:
+        raise ValueError('cursor has expired; run the search again')
+    return row[0], json.loads(row[1])
+
+EXPORT_FIELDS = ('id', 'createdAt', 'mood', 'sentiment', 'text')
+
+def export_rows(conn, user_id):
+    # Iterate a server-side cursor in batches rather than fetchall()
+    cur = tuple_cursor(conn).execute(
+        f"SELECT {', '.join(EXPORT_FIELDS)} FROM entries WHERE user_id=? ORDER BY created_ms, id",
+        (user_id,)
+    )
+    while True:
+        batch = cur.fetchmany(EXPORT_BATCH_ROWS)
+        if not batch:
+            return
+        yield from batch
+
+def encode_ndjson(rows):
+    for row in rows:
+        yield jsonio.dumps_bytes(dict(zip(EXPORT_FIELDS, row))) + b'\n'
+
+def encode_csv(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+def chunked(pieces, compress=False):
+    """Group small text/bytes pieces into ~EXPORT_CHUNK_BYTES chunks, gzip-compressing them on the fly if asked."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for piece in pieces:
+        data = piece if isinstance(piece, bytes) else piece.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= EXPORT_CHUNK_BYTES:
+            out = b''.join(pending)
+            pending, size = [], 0
+            if gz:
+                out = gz.compress(out)
+            if out:
+                yield out
+    out = b''.join(pending)
+    if gz:
+        out = gz.compress(out) + gz.flush()
+    if out:
+        yield out
+
+@app.route('/api/entries/export')
+@auth_required
+def export_entries():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt == 'ndjson':
+        encoder, mimetype = encode_ndjson, 'application/x-ndjson'
+    elif fmt == 'csv':
+        encoder, mimetype = encode_csv, 'text/csv'
+    else:
+        return jsonify({'success': False, 'message': 'format must be ndjson or csv'}), 400
+
+    # Honours q-values ("gzip;q=0" refuses it); the stream only does gzip
+    compress = compression.negotiate(('gzip',)) == 'gzip'
+    rows = export_rows(get_db(), request.user['id'])
+    # stream_with_context keeps the app context, and so the pooled
+    # connection, alive until the last chunk has been sent
+    resp = Response(stream_with_context(chunked(encoder(rows), compress)), mimetype=mimetype)
+    filename = f"mood-journal-{datetime.datetime.utcnow():%Y%m%d}.{fmt}"
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    resp.vary.add('Accept-Encoding')
+    if compress:
+        resp.headers['Content-Encoding'] = 'gzip'
+    return resp
+
+
+def parse_import_row(item):
+    """Validate one imported entry and return (text, mood, createdAt, created_ms)."""
+    if not isinstance(item, dict):
+        raise ValueError('Entry must be a JSON object')
+    text = item.get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError('text is required')
+    mood = item.get('mood') or 'neutral'
+    if not isinstance(mood, str):
+        raise ValueError('mood must be a string')
+    created = item.get('createdAt')
+    if created is None:
+        created_at, created_ms = utc_now()
+    else:
+        dt = datetime.datetime.fromisoformat(str(created))
+        if dt.tzinfo:
+            dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        created_at, created_ms = dt.isoformat(), to_epoch_ms(dt)
+    return text, mood, created_at, created_ms
+
+def iter_ndjson(stream):
+    # Read the upload line by line so large imports are never buffered whole
+    for index, line in enumerate(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as e:
+            yield index, e
+
+def insert_entries(conn, user_id, batch):
+    """Insert parsed and scored (text, mood, createdAt, created_ms, sentiment) rows."""
+    conn.executemany(
+        'INSERT INTO entries (user_id,text,mood,sentiment,createdAt,created_ms) VALUES (?,?,?,?,?,?)',
+        [(user_id, text, mood, score, created_at, created_ms)
+         for text, mood, created_at, created_ms, score in batch]
+    )
+    aggregates.add_entries(conn, user_id, [
+        (created_at, mood, score) for _, mood, created_at, _, score in batch
+    ])
+
+@app.route('/api/entries/bulk', methods=['POST'])
+@auth_required
+def bulk_import_entries():
+    # Accepts a JSON array, or NDJSON (one entry per line) which is streamed.
+    # Valid rows are inserted in one transaction; invalid ones are reported.
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = iter_ndjson(request.stream)
+    else:
+        body = request.get_json(silent=True)
+        if not isinstance(body, list):
+            return jsonify({'success': False, 'message': 'Body must be a JSON array or NDJSON'}), 400
+        items = enumerate(body)
+
+    # Read, validate and score the whole upload before writing anything: a
+    # slow or stalled upload must not hold SQLite's write lock while it
+    # trickles in, so the transaction below only inserts
+    rows, failed, errors = [], 0, []
+    for index, item in items:
+        if len(rows) + failed >= BULK_MAX_ROWS:
+            return jsonify({'success': False, 'message': f'Imports are limited to {BULK_MAX_ROWS} entries'}), 413
+        try:
+            if isinstance(item, Exception):
+                raise item
+            text, mood, created_at, created_ms = parse_import_row(item)
+        except ValueError as e:
+            failed += 1
+            if len(errors) < BULK_MAX_ERRORS:
+                errors.append({'index': index, 'message': str(e)})
+            continue
+        rows.append((text, mood, created_at, created_ms, gemini_sentiment(text)))
+
+    user_id = request.user['id']
+    conn = get_db()
+    try:
+        for start in range(0, len(rows), BULK_BATCH_ROWS):
+            insert_entries(conn, user_id, rows[start:start + BULK_BATCH_ROWS])
+        if rows:
+            personality.invalidate(conn, user_id)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Bulk import failed: {e}")
+        return jsonify({'success': False, 'message': 'Database error during import'}), 500
+
+    if rows:
+        personality.schedule(user_id)
+    return jsonify({'success': True, 'imported': len(rows), 'failed': failed, 'errors': errors})
 
 @app.route('/api/entries/<int:entry_id>', methods=['DELETE'])
 @auth_required
 def delete_entry(entry_id):
     conn = get_db()
     c = conn.cursor()
-    c.execute('DELETE FROM entries WHERE id = ? AND user_id = ?', (entry_id, request.user['id']))
+    if SUPPORTS_RETURNING:
+        rows = c.execute('DELETE FROM entries WHERE id = ? AND user_id = ? RETURNING mood, sentiment, createdAt',
+                         (entry_id, request.user['id'])).fetchall()
+        entry = rows[0] if rows else None
+    else:
+        entry = c.execute('SELECT mood, sentiment, createdAt FROM entries WHERE id = ? AND user_id = ?',
+                          (entry_id, request.user['id'])).fetchone()
+        c.execute('DELETE FROM entries WHERE id = ? AND user_id = ?', (entry_id, request.user['id']))
+    deleted = entry is not None
+    if deleted and entry['createdAt'] and entry['mood']:
+        aggregates.remove_entry(conn, request.user['id'], entry['createdAt'], entry['mood'], entry['sentiment'] or 0.0)
+    if deleted:
+        personality.invalidate(conn, request.user['id'])
     conn.commit()
-    deleted = c.rowcount
-    conn.close()
 
     if deleted:
+        personality.schedule(request.user['id'])
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'error': 'Entry not found or not yours'}), 404
 
+STATS_PERIODS = {'week': 7, 'month': 30, 'year': 365}
+
+def stats_range(default_days=7):
+    """Resolve ?period=week|month|year or ?from=YYYY-MM-DD&to=YYYY-MM-DD into inclusive UTC days."""
+    today = datetime.datetime.utcnow().date()
+    start, end = request.args.get('from'), request.args.get('to')
+    if start or end:
+        end_day = datetime.date.fromisoformat(end) if end else today
+        start_day = datetime.date.fromisoformat(start) if start else end_day - datetime.timedelta(days=default_days - 1)
+        if start_day > end_day:
+            raise ValueError('from must not be after to')
+    else:
+        period = request.args.get('period')
+        days = STATS_PERIODS[period] if period else default_days
+        end_day = today
+        start_day = today - datetime.timedelta(days=days - 1)
+    return start_day.isoformat(), end_day.isoformat()
+
 @app.route('/api/stats/week')
 @auth_required
+@conditional('entries_rev', daily=True)
 def stats_week():
-    conn = get_db()
-    c = conn.cursor()
-    since = (datetime.datetime.utcnow() - datetime.timedelta(days=7)).isoformat()
-    rows = c.execute('SELECT mood, COUNT(*) as count FROM entries WHERE user_id=? AND createdAt>=? GROUP BY mood',
-                     (request.user['id'], since)).fetchall()
-    conn.close()
-    return jsonify({'success': True, 'stats': [dict(r) for r in rows]})
+    # The last 7 UTC days including today, served from the daily aggregates
+    today = datetime.datetime.utcnow().date()
+    start_day, end_day = (today - datetime.timedelta(days=6)).isoformat(), today.isoformat()
+    stats = aggregates.mood_totals(get_db(), request.user['id'], start_day, end_day)
+    return jsonify({'success': True, 'stats': [{'mood': s['mood'], 'count': s['count']} for s in stats]})
+
+@app.route('/api/stats')
+@auth_required
+@conditional('entries_rev', daily=True)
+def stats():
+    try:
+        start_day, end_day = stats_range()
+    except (KeyError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Invalid range: {e}'}), 400
+    stats = aggregates.mood_totals(get_db(), request.user['id'], start_day, end_day)
+    return jsonify({'success': True, 'from': start_day, 'to': end_day, 'stats': stats})
+
+@app.route('/api/stats/calendar')
+@auth_required
+@conditional('entries_rev', daily=True)
+def stats_calendar():
+    try:
+        start_day, end_day = stats_range(365)
+    except (KeyError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Invalid range: {e}'}), 400
+    days = aggregates.calendar(get_db(), request.user['id'], start_day, end_day)
+    return jsonify({'success': True, 'from': start_day, 'to': end_day, 'days': days})
 
 @app.route('/api/analyze', methods=['POST'])
 @auth_required
@@ -577,11 +1065,7 @@ def analyze_text():
     text = data.get('text', '')
     
     try:
-        response = requests.post(
-            "http://127.0.0.1:5003/predict",
-            json={"text": text},
-            timeout=15
-        )
+        response = http_client.analyzer.post("/predict", json={"text": text}, timeout=15)
         if response.status_code == 200:
             pers = response.json()
         else:
@@ -596,8 +1080,36 @@ def analyze_text():
     })
 
 
+@app.route('/api/analyze/batch', methods=['POST'])
+@auth_required
+def analyze_batch():
+    data = request.get_json() or {}
+    texts = data.get('texts')
+    if not isinstance(texts, list) or not texts:
+        return jsonify({'success': False, 'message': 'texts must be a non-empty list'}), 400
+    if len(texts) > ANALYZE_BATCH_MAX:
+        return jsonify({'success': False, 'message': f'At most {ANALYZE_BATCH_MAX} texts per batch'}), 413
+    if not all(isinstance(t, str) for t in texts):
+        return jsonify({'success': False, 'message': 'Every text must be a string'}), 400
+
+    profiles = estimate_personalities(texts)
+    results = []
+    for text, pers in zip(texts, profiles):
+        result = {'sentiment_score': gemini_sentiment(text), 'personality': pers.get('personality_profile')}
+        if 'error' in pers:
+            result['error'] = pers['error']
+        results.append(result)
+
+    return jsonify({
+        'success': True,
+        'results': results,
+        'failed': sum(1 for r in results if 'error' in r)
+    })
+
+
 @app.route('/api/chat', methods=['POST'])
 @auth_required
+@ratelimit.limit('chat')
 def chat_query():
     data = request.get_json() or {}
     message = data.get('message', '')
@@ -605,11 +1117,7 @@ def chat_query():
         return jsonify({'success': False, 'message': 'No message provided'}), 400
 
     try:
-        response = requests.post(
-            "http://127.0.0.1:5001/chat",
-            json={"message": message},
-            timeout=20
-        )
+        response = http_client.chat.post("/chat", json={"message": message}, timeout=20)
 
         if response.status_code != 200:
             return jsonify({'success': False, 'message': 'Gemini API error'}), 500
@@ -617,9 +1125,43 @@ def chat_query():
         reply = response.json().get('reply', '')
         return jsonify({'success': True, 'reply': reply})
 
+    except http_client.CircuitOpenError as e:
+        resp = jsonify({'success': False, 'message': 'The assistant is temporarily unavailable. Please try again shortly.'})
+        resp.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+        return resp, 503
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error contacting Gemini: {e}'}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+@auth_required
+@ratelimit.limit('chat')
+def chat_stream():
+    """Like /api/chat, but the reply is relayed as server-sent events while Gemini writes it."""
+    start = time.perf_counter()
+    data = request.get_json() or {}
+    message = data.get('message', '')
+    if not message:
+        return jsonify({'success': False, 'message': 'No message provided'}), 400
+
+    try:
+        # The read timeout applies to each gap between chunks, not the whole reply
+        upstream = http_client.chat.post("/chat/stream", json={"message": message}, timeout=20, stream=True)
+    except http_client.CircuitOpenError as e:
+        resp = jsonify({'success': False, 'message': 'The assistant is temporarily unavailable. Please try again shortly.'})
+        resp.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+        return resp, 503
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error contacting Gemini: {e}'}), 500
 
+    if upstream.status_code != 200:
+        upstream.close()
+        return jsonify({'success': False, 'message': 'Gemini API error'}), 500
+
+    stats = streaming.StreamStats('/api/chat/stream', start)
+    # chunk_size=None hands over each chunk as soon as it arrives
+    body = streaming.relay(upstream.iter_lines(chunk_size=None), upstream.close, stats)
+    return Response(body, mimetype='text/event-stream', headers=streaming.HEADERS)
+
 @app.route('/favicon.ico')
 def favicon():
     return '', 204
@@ -682,16 +1224,17 @@ def complete_oauth_login(provider, provider_id, email, name, avatar):
         user_id = user['id']
     else:
         # Create new user
-        c.execute('''INSERT INTO users (email, full_name, avatar, is_verified, oauth_provider, oauth_id, createdAt) 
-                     VALUES (?, ?, ?, 1, ?, ?, ?)''',
-                  (email, name, avatar, provider, provider_id, datetime.datetime.utcnow().isoformat()))
+        created_at, created_ms = utc_now()
+        c.execute('''INSERT INTO users (email, full_name, avatar, is_verified, oauth_provider, oauth_id, createdAt, created_ms) 
+                     VALUES (?, ?, ?, 1, ?, ?, ?, ?)''',
+                  (email, name, avatar, provider, provider_id, created_at, created_ms))
         user_id = c.lastrowid
     
     conn.commit()
-    conn.close()
     
     # Generate JWT token
-    token = jwt.encode({'id': user_id, 'email': email}, SECRET, algorithm='HS256')
+    verified_users.invalidate(user_id)
+    token = issue_token(user_id, email)
     
     # Send token back to frontend using postMessage
     return f"""
@@ -712,11 +1255,18 @@ def complete_oauth_login(provider, provider_id, email, name, avatar):
 # --- Health check endpoint ---
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'timestamp': datetime.datetime.utcnow().isoformat()})
+    return jsonify({
+        'status': 'ok',
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'caches': {'verified_users': verified_users.stats()},
+        'dependencies': {svc.name: svc.breaker.snapshot() for svc in http_client.SERVICES}
+    })
 
 # --- Main Entry Point ---
 if __name__ == '__main__':
     init_db()
+    outbox.start_dispatcher()
+    personality.start_worker()
     print("🚀 Server starting on port 5000...")
     print("📧 Email service configured for:", EMAIL_SERVICE_URL)
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
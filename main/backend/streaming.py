@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+
+import jsonio
+import metrics
+
+# --- Server-sent events ---
+# The chat proxy streams newline-delimited JSON ({"text": ...} per chunk, or
+# {"error": ...}); relay() turns that into SSE for the browser:
+#
+#     data: {"text": "..."}          one per chunk, as soon as it arrives
+#     event: done                    the reply is complete
+#     event: error                   the reply was cut short
+#
+# Nothing is buffered on the way: the next upstream line is only read once
+# the previous event has been written to the client, so a slow client slows
+# the proxy (and Gemini) down instead of filling memory. When the client goes
+# away the server closes the generator, which closes the upstream response.
+
+HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Tell nginx-style proxies not to buffer the stream
+    'X-Accel-Buffering': 'no',
+}
+
+
+def event(data, name=None):
+    prefix = f'event: {name}\n'.encode() if name else b''
+    return prefix + b'data: ' + jsonio.dumps_bytes(data) + b'\n\n'
+
+
+class StreamStats:
+    """Time-to-first-token and total duration of one streamed response."""
+
+    def __init__(self, route, start):
+        self.route = route
+        self.start = start
+        self.first_token = None
+        # Stays 'disconnected' unless the stream ends on its own
+        self.outcome = 'disconnected'
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            metrics.stream_first_token.observe(self.first_token - self.start, self.route)
+
+    def finish(self):
+        metrics.stream_duration.observe(time.perf_counter() - self.start, self.route, self.outcome)
+
+
+def _translate(line, stats):
+    """Turn one upstream NDJSON line into an SSE event, or None to skip it."""
+    if not line.strip():
+        return None
+    chunk = json.loads(line)
+    if 'error' in chunk:
+        print(f"Chat stream error: {chunk['error']}")
+        stats.outcome = 'upstream_error'
+        return event({'message': 'The assistant could not finish this reply.'}, 'error')
+    stats.token()
+    return event({'text': chunk.get('text', '')})
+
+
+def relay(lines, close, stats):
+    """Relay upstream NDJSON lines as SSE; close() releases the upstream response."""
+    try:
+        for line in lines:
+            out = _translate(line, stats)
+            if out:
+                yield out
+            if stats.outcome == 'upstream_error':
+                return
+        stats.outcome = 'completed'
+        yield event({}, 'done')
+    except Exception as e:
+        # Read timeout or dropped connection to the proxy
+        print(f"Chat stream error: {e}")
+        stats.outcome = 'upstream_error'
+        yield event({'message': 'The assistant could not finish this reply.'}, 'error')
+    finally:
+        close()
+        stats.finish()
+
+
+async def relay_async(lines, close, stats):
+    """relay() for the ASGI mode: lines is an async iterator, close() a coroutine function."""
+    try:
+        async for line in lines:
+            out = _translate(line, stats)
+            if out:
+                yield out
+            if stats.outcome == 'upstream_error':
+                return
+        stats.outcome = 'completed'
+        yield event({}, 'done')
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        stats.outcome = 'upstream_error'
+        yield event({'message': 'The assistant could not finish this reply.'}, 'error')
+    finally:
+        # On client disconnect this runs inside a cancelled task; shield the
+        # close so the upstream connection is still released
+        try:
+            await asyncio.shield(close())
+        finally:
+            stats.finish()
@@ -0,0 +1,122 @@
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The app reads its settings at import time: point it at a scratch database,
+# cheap scrypt parameters and in-thread hashing before anything imports it
+_tmpdir = tempfile.mkdtemp(prefix='mj-test-')
+os.environ['MJ_DB'] = os.path.join(_tmpdir, 'test.db')
+os.environ['MJ_SCRYPT_N'] = '1024'
+os.environ['MJ_HASH_WORKERS'] = '0'
+os.environ['MJ_PERSONALITY_PRECOMPUTE'] = '0'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt  # noqa: E402
+import pytest  # noqa: E402
+
+import db  # noqa: E402
+import http_client  # noqa: E402
+import ratelimit  # noqa: E402
+import server  # noqa: E402
+
+server.init_db()
+
+_emails = itertools.count()
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limits(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'store', ratelimit.MemoryStore())
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+@pytest.fixture
+def conn():
+    conn = db.pool.acquire()
+    yield conn
+    db.pool.release(conn)
+
+
+@pytest.fixture
+def make_user(conn):
+    """Create a user; returns (id, email). `stored` is the raw password column value."""
+    def make(password='secret', verified=True, stored=None):
+        email = f'user{next(_emails)}@example.com'
+        if stored is None:
+            stored = server.hash_pwd(password)
+        cur = conn.execute('INSERT INTO users (email, password, is_verified, createdAt) VALUES (?,?,?,?)',
+                           (email, stored, int(verified), '2024-01-01T00:00:00'))
+        conn.commit()
+        return cur.lastrowid, email
+    return make
+
+
+def bearer(claims):
+    return {'Authorization': 'Bearer ' + jwt.encode(claims, server.SECRET, algorithm='HS256')}
+
+
+def user_id_of(headers):
+    token = headers['Authorization'].split(' ', 1)[1]
+    return jwt.decode(token, server.SECRET, algorithms=['HS256'])['id']
+
+
+@pytest.fixture
+def auth(make_user):
+    user_id, email = make_user()
+    return {'Authorization': 'Bearer ' + server.issue_token(user_id, email)}
+
+
+class StubService(BaseHTTPRequestHandler):
+    """Stand-in for the chat, analyzer and email services: a canned JSON reply per path."""
+
+    protocol_version = 'HTTP/1.1'
+    replies = {
+        '/chat': {'reply': 'hello from the stub'},
+        '/predict': {'personality_profile': {'openness': 0.5}},
+        '/analyze_entries': {'personality_profile': {'openness': 0.7}},
+    }
+    calls = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        StubService.calls.append((self.path, json.loads(body or b'{}')))
+        if self.path == '/chat/stream':
+            reply = b'{"text": "hel"}\n{"text": "lo"}\n'
+            content_type = 'application/x-ndjson'
+        else:
+            reply = json.dumps(self.replies.get(self.path, {'success': True})).encode()
+            content_type = 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def services(monkeypatch):
+    """Point every downstream client at a local stub; yields the list of (path, body) calls."""
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), StubService)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{stub.server_address[1]}'
+    for svc in http_client.SERVICES:
+        monkeypatch.setattr(svc, 'base_url', base)
+        monkeypatch.setattr(svc, 'breaker', http_client.CircuitBreaker())
+    for svc in http_client.ASYNC_SERVICES:
+        monkeypatch.setattr(svc, '_client', None)
+        monkeypatch.setattr(svc, 'breaker', svc.sync_client.breaker)
+    StubService.calls = []
+    yield StubService.calls
+    stub.shutdown()
@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('a2wsgi')
+pytest.importorskip('httpx')
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import asgi  # noqa: E402
+import outbox  # noqa: E402
+import ratelimit  # noqa: E402
+from conftest import bearer, user_id_of  # noqa: E402
+
+
+@pytest.fixture
+def asgi_client(monkeypatch, services):
+    # Delivery is not under test here; keep the dispatcher from claiming rows
+    monkeypatch.setattr(outbox, 'start_dispatcher', lambda: None)
+    with TestClient(asgi.app) as c:
+        yield c
+
+
+BAD_TOKENS = [
+    {},
+    {'Authorization': 'Token abc'},
+    {'Authorization': 'Bearer not-a-jwt'},
+    bearer({'email': 'x@example.com'}),            # no id, no verified claim
+    bearer({'email': 'x@example.com', 'verified': True}),  # verified, but no id
+]
+
+
+@pytest.mark.parametrize('headers', BAD_TOKENS)
+@pytest.mark.parametrize('path', ['/api/chat', '/api/analyze'])
+def test_bad_tokens_are_401_in_both_modes(asgi_client, client, headers, path):
+    flask = client.post(path, json={'message': 'hi', 'text': 'hi'}, headers=headers)
+    starlette = asgi_client.post(path, json={'message': 'hi', 'text': 'hi'}, headers=headers)
+    assert flask.status_code == starlette.status_code == 401
+    assert starlette.json()['success'] is False
+
+
+def test_chat_matches_flask(asgi_client, client, auth, services):
+    flask = client.post('/api/chat', json={'message': 'hi'}, headers=auth)
+    starlette = asgi_client.post('/api/chat', json={'message': 'hi'}, headers=auth)
+    assert flask.status_code == starlette.status_code == 200
+    assert flask.get_json() == starlette.json() == {'success': True, 'reply': 'hello from the stub'}
+    assert asgi_client.post('/api/chat', json={}, headers=auth).status_code == 400
+
+
+def test_chat_stream_matches_flask(asgi_client, client, auth, services):
+    flask = client.post('/api/chat/stream', json={'message': 'hi'}, headers=auth)
+    starlette = asgi_client.post('/api/chat/stream', json={'message': 'hi'}, headers=auth)
+    assert flask.status_code == starlette.status_code == 200
+    assert starlette.headers['content-type'].startswith('text/event-stream')
+    expected = 'data: {"text":"hel"}\n\ndata: {"text":"lo"}\n\nevent: done\ndata: {}\n\n'
+    assert flask.get_data(as_text=True) == starlette.text == expected
+
+
+def test_personality_matches_flask(asgi_client, client, auth, services, conn):
+    user_id = user_id_of(auth)
+    conn.execute('INSERT INTO entries (user_id, text, mood, createdAt, created_ms) VALUES (?,?,?,?,?)',
+                 (user_id, 'a calm day', 'calm', '2024-01-01T00:00:00', 0))
+    conn.commit()
+    starlette = asgi_client.get('/api/personality', headers=auth).json()
+    assert starlette == {'success': True, 'personality': {'openness': 0.7}}
+    # Now cached: Flask answers from the same row without calling the analyzer
+    calls = len(services)
+    assert client.get('/api/personality', headers=auth).get_json() == starlette
+    assert len(services) == calls
+
+
+def test_flask_routes_are_mounted(asgi_client, client, auth):
+    flask = client.get('/api/auth/me', headers=auth)
+    starlette = asgi_client.get('/api/auth/me', headers=auth)
+    assert flask.status_code == starlette.status_code == 200
+    assert flask.get_json() == starlette.json()
+
+
+
+def test_reset_password_is_limited_like_flask(asgi_client, client, make_user, monkeypatch, services):
+    monkeypatch.setitem(ratelimit.RULES, 'reset_password', {'email': ratelimit.Limit(1, 60)})
+    _, email = make_user()
+    reset = {'email': email, 'code': '123456', 'password': 'new pw'}
+    assert asgi_client.post('/api/auth/reset-password', json=reset).status_code == 200
+    flask = client.post('/api/auth/reset-password', json=reset)
+    starlette = asgi_client.post('/api/auth/reset-password', json=reset)
+    assert flask.status_code == starlette.status_code == 429
+    assert starlette.headers['Retry-After']
@@ -0,0 +1,78 @@
+import io
+import json
+import sqlite3
+
+import db
+import server
+from conftest import user_id_of
+
+
+class SlowUpload(io.BytesIO):
+    """An NDJSON body that runs `during()` once the client has sent half of it."""
+
+    def __init__(self, lines, during):
+        super().__init__(b''.join(lines))
+        self.halfway = len(self.getvalue()) // 2
+        self.during = during
+        self.result = None
+
+    def _check(self):
+        if self.result is None and self.tell() >= self.halfway:
+            self.result = self.during()
+
+    def read(self, *args):
+        data = super().read(*args)
+        self._check()
+        return data
+
+    def readline(self, *args):
+        line = super().readline(*args)
+        self._check()
+        return line
+
+    def readinto(self, buffer):
+        size = super().readinto(buffer)
+        self._check()
+        return size
+
+
+def ndjson(rows):
+    return [json.dumps(row).encode() + b'\n' for row in rows]
+
+
+def test_upload_does_not_hold_the_write_lock(client, auth):
+    def write_elsewhere():
+        # Another request's write, with no patience for a held lock
+        other = sqlite3.connect(db.DB, timeout=0)
+        try:
+            other.execute("UPDATE users SET bio = 'x' WHERE id = ?", (user_id_of(auth),))
+            other.commit()
+            return 'ok'
+        except sqlite3.OperationalError as e:
+            return str(e)
+        finally:
+            other.close()
+
+    rows = [{'text': f'imported {i}', 'mood': 'calm'} for i in range(1200)]
+    upload = SlowUpload(ndjson(rows), write_elsewhere)
+    resp = client.post('/api/entries/bulk', input_stream=upload, content_length=len(upload.getvalue()),
+                       content_type='application/x-ndjson', headers=auth)
+    assert resp.status_code == 200
+    assert resp.get_json()['imported'] == 1200
+    assert upload.result == 'ok'
+
+
+def test_invalid_rows_are_reported_and_valid_ones_kept(client, auth):
+    body = b''.join(ndjson([{'text': 'fine'}, {'mood': 'sad'}])) + b'not json\n'
+    resp = client.post('/api/entries/bulk', data=body, content_type='application/x-ndjson', headers=auth)
+    result = resp.get_json()
+    assert (result['imported'], result['failed']) == (1, 2)
+    assert [e['index'] for e in result['errors']] == [1, 2]
+
+
+def test_oversized_import_writes_nothing(client, auth, conn, monkeypatch):
+    monkeypatch.setattr(server, 'BULK_MAX_ROWS', 3)
+    resp = client.post('/api/entries/bulk', json=[{'text': f'e{i}'} for i in range(5)], headers=auth)
+    assert resp.status_code == 413
+    count = conn.execute('SELECT COUNT(*) FROM entries WHERE user_id = ?', (user_id_of(auth),)).fetchone()[0]
+    assert count == 0
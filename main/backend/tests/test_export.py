@@ -0,0 +1,37 @@
+import gzip
+import json
+
+import pytest
+
+
+@pytest.fixture
+def journal(client, auth):
+    entries = [{'text': f'entry {i}', 'mood': 'calm', 'createdAt': f'2024-01-{1 + i:02d}T12:00:00'} for i in range(3)]
+    assert client.post('/api/entries/bulk', json=entries, headers=auth).status_code == 200
+    return auth
+
+
+def export(client, headers, accept_encoding=None):
+    if accept_encoding is not None:
+        headers = {**headers, 'Accept-Encoding': accept_encoding}
+    resp = client.get('/api/entries/export', headers=headers)
+    assert resp.status_code == 200
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    return resp
+
+
+def lines(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_export_is_gzipped_when_accepted(client, journal):
+    resp = export(client, journal, 'gzip, deflate')
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert len(lines(gzip.decompress(resp.data))) == 3
+
+
+@pytest.mark.parametrize('accept_encoding', [None, 'identity', 'gzip;q=0', 'x-gzip-not'])
+def test_export_is_plain_otherwise(client, journal, accept_encoding):
+    resp = export(client, journal, accept_encoding)
+    assert 'Content-Encoding' not in resp.headers
+    assert len(lines(resp.data)) == 3
@@ -0,0 +1,110 @@
+import asyncio
+import socket
+import socketserver
+import threading
+
+import pytest
+import requests
+
+import http_client
+
+
+class HangUp(socketserver.BaseRequestHandler):
+    """Reads one request, then closes the connection without answering."""
+
+    requests = 0
+
+    def handle(self):
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                return
+            data += chunk
+        HangUp.requests += 1
+
+
+@pytest.fixture
+def hang_up():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), HangUp)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    HangUp.requests = 0
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def closed_port():
+    # Bound and closed again: nothing listens there, so connecting is refused
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{s.getsockname()[1]}'
+
+
+def make_client(base_url):
+    return http_client.ServiceClient('test', base_url, retries=2, backoff=0)
+
+
+def test_post_is_not_retried_once_sent(hang_up):
+    svc = make_client(hang_up)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        svc.post('/chat', json={'message': 'hi'})
+    assert HangUp.requests == 1
+
+
+def test_get_is_retried_once_sent(hang_up):
+    svc = make_client(hang_up)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        svc.get('/health')
+    assert HangUp.requests == 3
+
+
+def test_refused_connection_is_retried(closed_port, monkeypatch):
+    svc = make_client(closed_port)
+    sleeps = []
+    monkeypatch.setattr(svc, '_sleep', sleeps.append)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        svc.post('/chat', json={'message': 'hi'})
+    assert sleeps == [0, 1]
+
+
+def _async_call(base_url, method):
+    pytest.importorskip('httpx')
+    svc = http_client.AsyncServiceClient(make_client(base_url))
+
+    async def call():
+        try:
+            await svc.request(method, '/chat')
+        finally:
+            await svc.aclose()
+    return asyncio.run(call())
+
+
+def test_async_post_is_not_retried_once_sent(hang_up):
+    import httpx
+    with pytest.raises(httpx.RemoteProtocolError):
+        _async_call(hang_up, 'POST')
+    assert HangUp.requests == 1
+
+
+def test_async_get_is_retried_once_sent(hang_up):
+    import httpx
+    with pytest.raises(httpx.RemoteProtocolError):
+        _async_call(hang_up, 'GET')
+    assert HangUp.requests == 3
+
+
+def test_async_refused_connection_is_retried(closed_port, monkeypatch):
+    import httpx
+    attempts = []
+    real_send = httpx.AsyncClient.send
+
+    async def send(self, request, **kwargs):
+        attempts.append(request.method)
+        return await real_send(self, request, **kwargs)
+    monkeypatch.setattr(httpx.AsyncClient, 'send', send)
+    with pytest.raises(httpx.ConnectError):
+        _async_call(closed_port, 'POST')
+    assert attempts == ['POST'] * 3
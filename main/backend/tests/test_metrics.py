@@ -0,0 +1,30 @@
+import pytest
+
+import metrics
+
+REMOTE = {'REMOTE_ADDR': '203.0.113.5'}
+
+
+def scrape(client, headers=None, environ=None):
+    return client.get('/metrics', headers=headers or {}, environ_base=environ or {}).status_code
+
+
+def test_local_scrape_is_allowed_without_token(client):
+    assert scrape(client) == 200
+    assert scrape(client, environ={'REMOTE_ADDR': '::1'}) == 200
+
+
+@pytest.mark.parametrize('headers,environ', [
+    (None, REMOTE),
+    # A local reverse proxy relaying someone else's request
+    ({'X-Forwarded-For': '203.0.113.5'}, None),
+])
+def test_other_scrapes_are_refused_without_token(client, headers, environ):
+    assert scrape(client, headers, environ) == 403
+
+
+def test_token_is_required_once_set(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'TOKEN', 's3cret')
+    assert scrape(client) == 403
+    assert scrape(client, {'Authorization': 'Bearer wrong'}, REMOTE) == 403
+    assert scrape(client, {'Authorization': 'Bearer s3cret'}, REMOTE) == 200
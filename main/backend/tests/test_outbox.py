@@ -0,0 +1,85 @@
+import socket
+
+import pytest
+
+import http_client
+import outbox
+
+
+def rows(conn, email):
+    return [tuple(r) for r in conn.execute(
+        'SELECT kind, status, attempts FROM email_outbox WHERE email = ? ORDER BY id', (email,))]
+
+
+def sent_to(calls, email):
+    return [path for path, body in calls if body.get('email') == email]
+
+
+@pytest.fixture
+def unverified(make_user):
+    return make_user(verified=False)[1]
+
+
+def test_repeated_enqueues_coalesce(conn, unverified):
+    for _ in range(3):
+        outbox.enqueue(conn, outbox.VERIFICATION, unverified)
+    outbox.enqueue(conn, outbox.PASSWORD_RESET, unverified)
+    conn.commit()
+    assert rows(conn, unverified) == [('verification', 'pending', 0), ('password_reset', 'pending', 0)]
+
+
+def test_resend_clicks_queue_one_message(client, conn, unverified):
+    for _ in range(3):
+        assert client.post('/api/auth/resend-verification', json={'email': unverified}).status_code == 200
+    assert rows(conn, unverified) == [('verification', 'pending', 0)]
+
+
+def test_each_message_is_delivered_once(conn, unverified, services):
+    outbox.enqueue(conn, outbox.VERIFICATION, unverified)
+    conn.commit()
+    # A resend while the message is being delivered still joins it
+    claimed = outbox.claim(conn)
+    outbox.enqueue(conn, outbox.VERIFICATION, unverified)
+    conn.commit()
+    for message in claimed:
+        outbox.deliver(conn, message)
+    outbox.run_once(conn)
+    assert sent_to(services, unverified) == ['/send-verification-code']
+    assert rows(conn, unverified) == [('verification', 'sent', 1)]
+
+    # Once sent, a new request is a new message
+    outbox.enqueue(conn, outbox.VERIFICATION, unverified)
+    conn.commit()
+    outbox.run_once(conn)
+    assert sent_to(services, unverified) == ['/send-verification-code'] * 2
+
+
+def test_failed_delivery_is_retried_later(conn, unverified, monkeypatch):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        closed = f'http://127.0.0.1:{s.getsockname()[1]}'
+    monkeypatch.setattr(http_client.email, 'base_url', closed)
+    monkeypatch.setattr(http_client.email, 'breaker', http_client.CircuitBreaker())
+    monkeypatch.setattr(http_client.email, 'backoff', 0)
+    outbox.enqueue(conn, outbox.VERIFICATION, unverified)
+    conn.commit()
+    outbox.run_once(conn)
+    assert rows(conn, unverified) == [('verification', 'pending', 1)]
+    # Backed off: not due again yet
+    outbox.run_once(conn)
+    assert rows(conn, unverified) == [('verification', 'pending', 1)]
+
+
+def test_idle_claim_does_not_take_the_write_lock(conn, unverified):
+    outbox.enqueue(conn, outbox.VERIFICATION, unverified)
+    conn.commit()
+    # Not due yet
+    conn.execute("UPDATE email_outbox SET next_attempt_ms = ? WHERE email = ?", (outbox._now_ms() + 60_000, unverified))
+    conn.commit()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        assert outbox.claim(conn) == []
+    finally:
+        conn.set_trace_callback(None)
+    assert not [s for s in statements if s.startswith('BEGIN')]
@@ -0,0 +1,97 @@
+import hashlib
+import time
+
+import pytest
+
+import passwords
+
+
+@pytest.fixture
+def hasher():
+    return passwords.PasswordHasher(n=1024, r=8, p=1, workers=0)
+
+
+def test_hash_round_trip(hasher):
+    stored = hasher.hash('correct horse')
+    assert stored.startswith('scrypt$1024$8$1$')
+    assert hasher.verify('correct horse', stored) == (True, None)
+    assert hasher.verify('wrong horse', stored) == (False, None)
+
+
+def test_legacy_hash_is_upgraded(hasher):
+    stored = hashlib.sha256(b'old secret').hexdigest()
+    ok, new_hash = hasher.verify('old secret', stored)
+    assert ok and new_hash.startswith('scrypt$')
+    assert hasher.verify('old secret', new_hash) == (True, None)
+    assert hasher.verify('not it', stored) == (False, None)
+
+
+def test_older_cost_is_upgraded(hasher):
+    stored = passwords.PasswordHasher(n=512, workers=0).hash('secret')
+    ok, new_hash = hasher.verify('secret', stored)
+    assert ok and new_hash.startswith('scrypt$1024$')
+    # A wrong password never triggers a rehash
+    assert hasher.verify('nope', stored) == (False, None)
+
+
+@pytest.mark.parametrize('password,stored', [
+    ('secret', ''),                 # Google-only account
+    ('secret', None),
+    (None, 'scrypt$1024$8$1$c2FsdA$a2V5'),
+    ('secret', 'scrypt$not$a$hash'),
+])
+def test_unusable_input_still_costs_a_derivation(hasher, monkeypatch, password, stored):
+    calls = []
+    real = hasher._derive
+    monkeypatch.setattr(hasher, '_derive', lambda *args: calls.append(args) or real(*args))
+    assert hasher.verify(password, stored) == (False, None)
+    assert len(calls) == 1
+
+
+def test_login_upgrades_a_legacy_hash(client, conn, make_user):
+    user_id, email = make_user(stored=hashlib.sha256(b'legacy pw').hexdigest())
+    resp = client.post('/api/auth/login', json={'email': email, 'password': 'legacy pw'})
+    assert resp.status_code == 200
+    stored = conn.execute('SELECT password FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+    assert stored.startswith('scrypt$')
+    assert client.post('/api/auth/login', json={'email': email, 'password': 'legacy pw'}).status_code == 200
+
+
+def test_login_answers_503_when_the_hasher_is_busy(client, make_user, monkeypatch):
+    _, email = make_user(password='pw')
+
+    def busy(*args):
+        raise passwords.HasherBusy('full')
+    monkeypatch.setattr(passwords.hasher, '_derive', busy)
+    resp = client.post('/api/auth/login', json={'email': email, 'password': 'pw'})
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '1'
+
+
+def test_timed_out_hash_keeps_its_slot_until_done():
+    # p=16 makes each hash take a while without using more memory
+    pool = passwords.PasswordHasher(n=2 ** 14, r=8, p=16, workers=1, max_pending=1, timeout=0.05)
+    try:
+        with pytest.raises(passwords.HasherBusy):
+            pool.hash('slow')
+        # The job is still running in the pool, so its slot is still taken
+        assert pool.pending == 1
+        with pytest.raises(passwords.HasherBusy, match='Too many'):
+            pool.hash('next')
+        deadline = time.monotonic() + 30
+        while pool.pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
+
+
+def test_pool_is_spawned_where_there_is_no_forkserver(monkeypatch):
+    # e.g. Windows
+    monkeypatch.setattr(passwords.multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    pool = passwords.PasswordHasher(n=1024, workers=1)
+    try:
+        assert pool.verify('pw', pool.hash('pw')) == (True, None)
+        assert pool._pool._mp_context.get_start_method() == 'spawn'
+    finally:
+        pool.shutdown()
@@ -0,0 +1,93 @@
+import itertools
+
+import pytest
+
+import ratelimit
+
+_keys = itertools.count()
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, clock):
+    if request.param == 'memory':
+        return ratelimit.MemoryStore(clock=clock)
+    return ratelimit.SQLiteStore(clock=clock)
+
+
+def test_bucket_allows_a_burst_then_refills(store, clock):
+    key, limit = f'test:{next(_keys)}', ratelimit.Limit(3, 60)
+    assert [store.hit(key, limit) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.hit(key, limit) == pytest.approx(20.0)
+    clock.now += 20
+    assert store.hit(key, limit) == 0.0
+    assert store.hit(key, limit) > 0
+
+
+def test_memory_store_forgets_least_recent_keys(clock):
+    store = ratelimit.MemoryStore(max_keys=2, clock=clock)
+    limit = ratelimit.Limit(1, 60)
+    store.hit('a', limit)
+    store.hit('b', limit)
+    store.hit('c', limit)
+    assert store.hit('a', limit) == 0.0  # 'a' was dropped, so it starts full again
+    assert store.hit('c', limit) > 0
+
+
+def test_rules_can_be_overridden_or_switched_off():
+    rules = ratelimit.load_rules({'MJ_RATELIMIT_LOGIN_IP': '50/10', 'MJ_RATELIMIT_LOGIN_EMAIL': 'off'})
+    assert (rules['login']['ip'].capacity, rules['login']['ip'].seconds) == (50, 10.0)
+    assert 'email' not in rules['login']
+
+
+def test_login_is_limited_per_email(client, make_user, monkeypatch):
+    monkeypatch.setitem(ratelimit.RULES, 'login', {'email': ratelimit.Limit(2, 60)})
+    _, email = make_user(password='pw')
+    for _ in range(2):
+        assert client.post('/api/auth/login', json={'email': email, 'password': 'wrong'}).status_code == 401
+    # Case and spacing do not make a new bucket
+    resp = client.post('/api/auth/login', json={'email': f' {email.upper()} ', 'password': 'pw'})
+    assert resp.status_code == 429
+    assert int(resp.headers['Retry-After']) >= 1
+    _, other = make_user(password='pw')
+    assert client.post('/api/auth/login', json={'email': other, 'password': 'pw'}).status_code == 200
+
+
+def test_chat_is_limited_per_user(client, auth, monkeypatch, services):
+    monkeypatch.setitem(ratelimit.RULES, 'chat', {'user': ratelimit.Limit(1, 60)})
+    assert client.post('/api/chat', json={'message': 'hi'}, headers=auth).status_code == 200
+    assert client.post('/api/chat', json={'message': 'hi'}, headers=auth).status_code == 429
+
+
+@pytest.mark.parametrize('proxies,forwarded_for,expected', [
+    (0, 'spoofed, 203.0.113.7', '10.0.0.1'),
+    (1, 'spoofed-1, 203.0.113.7', '203.0.113.7'),
+    (1, '203.0.113.7', '203.0.113.7'),
+    (2, 'spoofed, 203.0.113.7, 10.0.0.2', '203.0.113.7'),
+    (2, '203.0.113.7', '203.0.113.7'),
+    (1, None, '10.0.0.1'),
+])
+def test_client_ip_ignores_what_the_client_prepended(monkeypatch, proxies, forwarded_for, expected):
+    monkeypatch.setattr(ratelimit, 'TRUST_FORWARDED', proxies)
+    assert ratelimit.client_ip('10.0.0.1', forwarded_for) == expected
+
+
+def test_reset_password_is_limited_per_email(client, make_user, monkeypatch, services):
+    monkeypatch.setitem(ratelimit.RULES, 'reset_password', {'email': ratelimit.Limit(2, 60)})
+    _, email = make_user()
+    reset = {'email': email, 'code': '123456', 'password': 'new pw'}
+    assert [client.post('/api/auth/reset-password', json=reset).status_code for _ in range(3)] == [200, 200, 429]
+    # Refused before any hashing or call to the email service
+    assert len(services) == 2
@@ -0,0 +1,80 @@
+import server
+
+
+def add_entries(client, headers, texts):
+    entries = [{'text': text, 'mood': 'calm', 'createdAt': '2024-01-01T12:00:00'} for text in texts]
+    assert client.post('/api/entries/bulk', json=entries, headers=headers).status_code == 200
+
+
+def search(client, headers, **params):
+    resp = client.get('/api/entries/search', query_string=params, headers=headers)
+    return resp.status_code, resp.get_json()
+
+
+def test_pages_are_stable_while_the_index_changes(client, auth, make_user):
+    # Different lengths and term counts give every hit a different bm25 score
+    add_entries(client, auth, ['calm ' * (1 + i % 4) + 'walk ' * i for i in range(9)])
+    other_id, other_email = make_user()
+    other = {'Authorization': 'Bearer ' + server.issue_token(other_id, other_email)}
+
+    status, page = search(client, auth, q='calm', limit=3)
+    assert status == 200
+    seen = [hit['id'] for hit in page['results']]
+    while page['next_cursor']:
+        # Another user's writes change the index-wide statistics bm25 uses
+        add_entries(client, other, ['calm calm calm', 'calm and more walking'] * 5)
+        status, page = search(client, auth, q='calm', cursor=page['next_cursor'], limit=3)
+        assert status == 200
+        seen += [hit['id'] for hit in page['results']]
+    assert len(seen) == len(set(seen)) == 9
+
+
+def snapshot_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM search_snapshots').fetchone()[0]
+
+
+def test_only_a_second_page_takes_a_snapshot(client, auth, conn, monkeypatch):
+    monkeypatch.setattr(server, 'SEARCH_MAX_RESULTS', 5)
+    add_entries(client, auth, ['calm day'] * 8)
+    before = snapshot_count(conn)
+    _, page = search(client, auth, q='calm', limit=2)
+    assert page['next_cursor'] and snapshot_count(conn) == before
+    seen = [hit['id'] for hit in page['results']]
+    while page['next_cursor']:
+        _, page = search(client, auth, q='calm', cursor=page['next_cursor'], limit=2)
+        seen += [hit['id'] for hit in page['results']]
+    assert snapshot_count(conn) == before + 1
+    # Only the best SEARCH_MAX_RESULTS hits are paged through
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_snippets_are_escaped(client, auth):
+    add_entries(client, auth, ['a <script>alert(1)</script> calm & quiet day'])
+    _, page = search(client, auth, q='calm')
+    snippet = page['results'][0]['snippet']
+    assert '<script>' not in snippet
+    assert '&lt;script&gt;' in snippet and '<mark>calm</mark> &amp; quiet' in snippet
+
+
+def second_page(client, auth):
+    add_entries(client, auth, ['calm day'] * 3)
+    _, page = search(client, auth, q='calm', limit=1)
+    _, page = search(client, auth, q='calm', cursor=page['next_cursor'], limit=1)
+    return page
+
+
+def test_cursor_belongs_to_its_user(client, auth, make_user):
+    page = second_page(client, auth)
+    other_id, other_email = make_user()
+    other = {'Authorization': 'Bearer ' + server.issue_token(other_id, other_email)}
+    status, body = search(client, other, q='calm', cursor=page['next_cursor'])
+    assert status == 400
+    assert body['success'] is False
+
+
+def test_expired_cursor_is_rejected(client, auth, monkeypatch):
+    page = second_page(client, auth)
+    monkeypatch.setattr(server, 'SEARCH_SNAPSHOT_TTL_MS', -1000)
+    status, body = search(client, auth, q='calm', cursor=page['next_cursor'])
+    assert status == 400
+    assert 'expired' in body['message']
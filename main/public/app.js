@@ -19,6 +19,11 @@ const sounds = {
     sedative: 'sounds/sedative.mp3'
 };
 
+// Content-hashed URL for a static file when the backend injected one (see backend/assets.py)
+function assetUrl(path) {
+    return (window.ASSET_URLS && window.ASSET_URLS[path]) || path;
+}
+
 function getUserKey(key) {
     if (!state.user || !state.user.id) {
         console.warn('Attempted to access storage without user ID. Using temporary guest key.');
@@ -14092,7 +14097,7 @@ function initializeEntryFunctionality() {
                         renderer: 'svg',
                         loop: true,
                         autoplay: true,
-                        path: mood.e
+                        path: assetUrl(mood.e)
                     });
 
                     moodAnimations[mood.k] = animation;
@@ -18568,7 +18573,7 @@ function initializeSoundsFunctionality() {
         } else {
             currentSound = soundKey;
             const sound = soundData[soundKey];
-            relaxAudio.src = sound.url;
+            relaxAudio.src = assetUrl(sound.url);
 
             const playPromise = relaxAudio.play();
             if (playPromise !== undefined) {
@@ -25849,7 +25854,7 @@ function showNotes() {
                             renderer: 'svg',
                             loop: true,
                             autoplay: true,
-                            path: moodData.e
+                            path: assetUrl(moodData.e)
                         });
 
                         // Store animation reference
@@ -112,5 +112,31 @@ def analyze_entries():
         # If anything goes wrong, return a server error
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Takes a list of texts and returns one personality profile per text, in order.
+    A text that cannot be analyzed gets an "error" entry instead of failing the batch.
+    """
+    data = request.json
+    if not data or not isinstance(data.get('texts'), list):
+        return jsonify({"error": "'texts' must be a list of strings"}), 400
+
+    results = []
+    for text in data['texts']:
+        if not isinstance(text, str):
+            results.append({"error": "Text must be a string"})
+            continue
+        try:
+            sentiment_scores = sia.polarity_scores(text)
+            results.append({
+                "sentiment": sentiment_scores,
+                "personality_profile": map_sentiment_to_personality_percentages(sentiment_scores)
+            })
+        except Exception as e:
+            results.append({"error": f"An error occurred: {str(e)}"})
+
+    return jsonify({"results": results})
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5003, debug=True)
\ No newline at end of file